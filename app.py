@@ -1,14 +1,15 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 import streamlit as st
 import plotly.graph_objects as go
-from modules.text_analyzer import analyze_text
-from modules.image_analyzer import analyze_image
-from modules.voice_analyzer import analyze_voice, transcribe_audio
-from modules.emotion_fuser import fuse_emotions
-from modules.music_orchestrator import create_music_prompt
-from modules.music_generator import generate_music
+from modules.voice_analyzer import transcribe_audio
+from modules.multimodal_analyzer import analyze_inputs
+from modules.music_orchestrator import create_music_prompt, build_knowledge_context
+from modules.music_generator import generate_music_stream, segments_to_wav, segments_seconds
 from modules.explainer import explain_music
 from modules.feedback import save_feedback, get_feedback_summary, get_learned_rules
+from modules.preload import start_preload, get_preload_status
+from modules.pipeline import stage, run_stages
+from utils.llm_client import run_async
 from st_audiorec import st_audiorec
 
 st.set_page_config(page_title="Music2MyEars", page_icon="🎵", layout="centered")
@@ -432,6 +433,16 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# --- MODEL WARM-UP ---
+start_preload()
+preload = get_preload_status()
+if preload["enabled"] and preload["failed"]:
+    errors = "; ".join(f"{name}: {preload['errors'].get(name, 'unknown error')}" for name in preload["failed"])
+    st.caption(f"Model preload failed ({errors}) — it will be retried when you generate.")
+elif preload["enabled"] and preload["loading"]:
+    states = ", ".join(f"{name} {state}" for name, state in preload["models"].items())
+    st.caption(f"Warming up models ({states}) — the first generation may be slower until this finishes.")
+
 # --- INPUT SECTION ---
 text_input = st.text_area(
     "What's on your mind?",
@@ -521,7 +532,60 @@ if rules.get("reflection_count", 0) > 0:
 
         st.caption(f"Based on {rules.get('reflection_count', 0)} reflection(s) analyzing {rules.get('entries_analyzed', 0)} sessions")
 
+
 # --- GENERATE ---
+STAGE_LABELS = {
+    "analyze": "Reading the mood of your inputs",
+    "profile": "Applying your adjustments",
+    "knowledge": "Recalling what worked before",
+    "prompt": "Composing your soundtrack",
+    "generate": "Generating music",
+    "explain": "Writing the story of your music",
+}
+
+
+def _stream_music(prompt, gen_params):
+    """Play Version A as it decodes, then return the final A/B WAV bytes.
+
+    st.audio can't append to a clip, and replacing it restarts playback, so the
+    preview is only swapped once the clip it is playing has run out; the new
+    one carries on with everything decoded since.
+    """
+    preview = st.empty()
+    pending = []
+    playing_until = 0.0
+    stream = generate_music_stream(prompt, **gen_params)
+    while True:
+        try:
+            segments = next(stream)
+        except StopIteration as done:
+            preview.empty()
+            return done.value
+        pending.append(segments[0])
+        if time.monotonic() < playing_until:
+            continue
+        with preview.container():
+            st.caption("Previewing Version A while the rest renders...")
+            st.audio(segments_to_wav(pending), format="audio/wav", autoplay=True)
+        playing_until = time.monotonic() + segments_seconds(pending)
+        pending = []
+
+
+def _apply_overrides(ai_profile, slider_vals):
+    """Sliders the user moved away from the AI defaults replace the AI values."""
+    final_profile = dict(ai_profile)
+    overrides = []
+    for dim, slider_val in slider_vals.items():
+        ai_val = ai_profile.get(dim, 50)
+        if slider_val != defaults.get(dim, 50):
+            final_profile[dim] = slider_val
+            overrides.append(dim)
+        else:
+            final_profile[dim] = ai_val
+    final_profile["overrides"] = overrides
+    return final_profile
+
+
 if st.button("Generate Music", type="primary", use_container_width=True):
     has_text = bool(text_input and text_input.strip())
     has_image = image_file is not None
@@ -534,68 +598,65 @@ if st.button("Generate Music", type="primary", use_container_width=True):
     # Read file bytes upfront (before threads)
     image_bytes = image_file.getvalue() if has_image else None
     voice_bytes = voice_bytes_recorded if has_voice else None
-
-    # Step A: Analyze inputs in parallel
-    mood_list = []
-    with st.spinner("Analyzing your inputs..."):
-        tasks = {}
-        with ThreadPoolExecutor() as executor:
-            if has_text:
-                tasks[executor.submit(analyze_text, text_input.strip())] = "text"
-            if has_image:
-                tasks[executor.submit(analyze_image, image_bytes)] = "image"
-            if has_voice:
-                tasks[executor.submit(analyze_voice, voice_bytes)] = "voice"
-            for future in as_completed(tasks):
-                mood_list.append(future.result())
-
-    # Step B: Fuse emotions
-    with st.spinner("Building emotional profile..."):
-        ai_profile = fuse_emotions(mood_list)
-
-    st.session_state["ai_profile"] = ai_profile
-
-    # Step C: Apply slider overrides
-    final_profile = dict(ai_profile)
-    overrides = []
     slider_vals = {"energy": slider_energy, "style": slider_style, "warmth": slider_warmth, "arc": slider_arc}
+    gen_params = {
+        "max_new_tokens": DURATION_TOKENS[duration],
+        "temperature": 1.0,
+        "guidance_scale": 3.0,
+    }
 
-    for dim, slider_val in slider_vals.items():
-        ai_val = ai_profile.get(dim, 50)
-        if slider_val != defaults.get(dim, 50):
-            final_profile[dim] = slider_val
-            overrides.append(dim)
-        else:
-            final_profile[dim] = ai_val
+    # Analysis and fusion are one Gemini round trip (see multimodal_analyzer), then
+    # everything downstream starts as soon as its inputs exist. Explanation only needs
+    # the prompt, so it runs alongside generation.
+    stages = {}
+    stages["analyze"] = stage(lambda: run_async(analyze_inputs(
+        text_input.strip() if has_text else None, image_bytes, voice_bytes
+    )))
+    stages["profile"] = stage(lambda analyze: _apply_overrides(analyze[1], slider_vals), deps=["analyze"])
+    # Few-shot examples are picked by slider distance, so they follow the user's overrides
+    stages["knowledge"] = stage(lambda profile: build_knowledge_context(profile.get("emotion", "neutral"), profile),
+                                deps=["profile"])
+    stages["prompt"] = stage(lambda profile, knowledge: create_music_prompt(profile, knowledge),
+                             deps=["profile", "knowledge"])
+    stages["generate"] = stage(lambda prompt: _stream_music(prompt, gen_params), deps=["prompt"], inline=True)
+    stages["explain"] = stage(
+        lambda analyze, profile, prompt: explain_music(
+            text_input or "", analyze[1], profile, profile["overrides"], prompt
+        ),
+        deps=["analyze", "profile", "prompt"],
+    )
 
-    final_profile["overrides"] = overrides
+    progress = st.empty()
+    active = []
 
-    # Step D: Orchestrate + Generate
-    with st.spinner("Composing your soundtrack..."):
-        music_prompt = create_music_prompt(final_profile)
+    def _show_progress(name, event):
+        if event == "start":
+            active.append(name)
+        else:
+            active.remove(name)
+        if active:
+            progress.caption(" · ".join(STAGE_LABELS[n] for n in active) + "...")
+        else:
+            progress.empty()
 
-    with st.spinner("Generating music... (this takes ~20-30s)"):
-        audio_list = generate_music(music_prompt, max_new_tokens=DURATION_TOKENS[duration])
+    with st.spinner("Creating your music..."):
+        results, stage_timings = run_stages(stages, on_event=_show_progress)
 
-    # Step E: Explain
-    with st.spinner("Writing the story of your music..."):
-        explanation = explain_music(
-            text_input or "", ai_profile, final_profile, overrides, music_prompt
-        )
+    mood_list, ai_profile = results["analyze"]
+    final_profile = results["profile"]
+    music_prompt = results["prompt"]
 
     # Store everything in session state so results survive reruns
+    st.session_state["ai_profile"] = ai_profile
     st.session_state["music_prompt"] = music_prompt
     st.session_state["final_profile"] = final_profile
-    st.session_state["audio_list"] = audio_list
+    st.session_state["audio_list"] = results["generate"]
     st.session_state["ai_profile_result"] = ai_profile
-    st.session_state["overrides_result"] = overrides
+    st.session_state["overrides_result"] = final_profile["overrides"]
     st.session_state["mood_list_result"] = mood_list
-    st.session_state["explanation"] = explanation
-    st.session_state["gen_params"] = {
-        "max_new_tokens": DURATION_TOKENS[duration],
-        "temperature": 1.0,
-        "guidance_scale": 3.0,
-    }
+    st.session_state["explanation"] = results["explain"]
+    st.session_state["gen_params"] = gen_params
+    st.session_state["stage_timings"] = stage_timings
     st.session_state["has_results"] = True
 
 # --- RESULTS (persisted via session_state) ---
@@ -745,6 +806,32 @@ if st.session_state.get("has_results"):
         else:
             st.write("*(no descriptors)*")
 
+    # Stage timeline — overlapping bars ran concurrently
+    stage_timings = st.session_state.get("stage_timings")
+    if stage_timings:
+        with st.expander("Pipeline timing"):
+            ordered = sorted(stage_timings.items(), key=lambda kv: kv[1]["start"])
+            timing_fig = go.Figure(go.Bar(
+                y=[STAGE_LABELS.get(n, n) for n, _ in ordered],
+                x=[t["duration"] for _, t in ordered],
+                base=[t["start"] for _, t in ordered],
+                orientation="h",
+                marker=dict(color="#E8945A"),
+                hovertemplate="%{y}: %{x:.2f}s<extra></extra>",
+            ))
+            timing_fig.update_layout(
+                paper_bgcolor="rgba(0,0,0,0)",
+                plot_bgcolor="rgba(0,0,0,0)",
+                height=40 * len(ordered) + 60,
+                margin=dict(t=10, b=30, l=10, r=10),
+                xaxis=dict(title="seconds", gridcolor="rgba(255, 255, 255, 0.05)", color="#8A8A8E"),
+                yaxis=dict(autorange="reversed", color="#8A8A8E"),
+                font=dict(family="Source Sans 3"),
+            )
+            st.plotly_chart(timing_fig, use_container_width=True)
+            wall = max(t["start"] + t["duration"] for t in stage_timings.values())
+            st.caption(f"Total {wall:.1f}s")
+
     st.divider()
 
     # --- FEEDBACK ---
@@ -776,7 +863,9 @@ if st.session_state.get("has_results"):
                     f"Replay rate: {summary['replay_rate']}%"
                 )
             with col_s2:
-                if summary["reflections_completed"] > 0:
+                if summary["reflection"]["state"] != "idle":
+                    st.caption("Learning from recent ratings in the background...")
+                elif summary["reflections_completed"] > 0:
                     st.caption(
                         f"Reflections: {summary['reflections_completed']} | "
                         f"Rules active: {summary['rules_active']} | "
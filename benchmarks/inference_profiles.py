@@ -0,0 +1,104 @@
+"""Compare MusicGen CPU inference profiles: tokens/sec and peak RSS.
+
+Each profile runs in its own subprocess so peak RSS is not polluted by the
+previous profile's weights.
+
+    python -m benchmarks.inference_profiles                     # all profiles, real model
+    python -m benchmarks.inference_profiles --tiny --tokens 100  # offline smoke run
+    python -m benchmarks.inference_profiles --profiles default int8 --threads 4 --out profiles.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_single(args):
+    """Benchmark the profile named in MUSICGEN_PROFILE inside this process and print a JSON line."""
+    from modules import music_generator
+
+    load_started = time.perf_counter()
+    if args.tiny:
+        from benchmarks.tiny_model import TinyProcessor, build_tiny_musicgen
+        music_generator._processor = TinyProcessor()
+        music_generator._model = music_generator._apply_profile(build_tiny_musicgen())
+    else:
+        music_generator._load_model()
+    load_s = time.perf_counter() - load_started
+
+    prompts = music_generator._variation_prompts(
+        "A gentle lo-fi piano melody with warm vinyl crackle and soft drums", 2
+    )
+    music_generator._generate_batch(prompts, max_new_tokens=8)  # warm-up
+
+    times = []
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        music_generator._generate_batch(prompts, max_new_tokens=args.tokens)
+        times.append(time.perf_counter() - started)
+
+    median = statistics.median(times)
+    print(json.dumps({
+        "profile": music_generator.INFERENCE_PROFILE,
+        "threads": music_generator.TORCH_THREADS or None,
+        "batch": len(prompts),
+        "max_new_tokens": args.tokens,
+        "load_s": round(load_s, 2),
+        "median_s": round(median, 3),
+        "tokens_per_s": round(args.tokens * len(prompts) / median, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+    }))
+
+
+def main():
+    from modules.music_generator import INFERENCE_PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(INFERENCE_PROFILES), choices=list(INFERENCE_PROFILES))
+    parser.add_argument("--tokens", type=int, default=250, help="max_new_tokens per run (250 = 5 sec)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="MUSICGEN_THREADS for every profile (0 = torch default)")
+    parser.add_argument("--tiny", action="store_true", help="use a tiny random-init model (no download)")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        _run_single(args)
+        return
+
+    results = []
+    for profile in args.profiles:
+        env = dict(os.environ, MUSICGEN_PROFILE=profile, MUSICGEN_THREADS=str(args.threads))
+        cmd = [sys.executable, "-m", "benchmarks.inference_profiles", "--run",
+               "--tokens", str(args.tokens), "--repeats", str(args.repeats)]
+        if args.tiny:
+            cmd.append("--tiny")
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{profile}: failed\n{proc.stderr.strip()[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'profile':<15}{'tokens/s':>10}{'median s':>10}{'peak RSS MB':>13}{'load s':>8}")
+    for r in results:
+        print(f"{r['profile']:<15}{r['tokens_per_s']:>10}{r['median_s']:>10}{r['peak_rss_mb']:>13}{r['load_s']:>8}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""End-to-end pipeline benchmark, runnable offline.
+
+Runs the same stage graph as the Generate button in app.py:
+analyze (one combined Gemini call, or per-source + fuse) → knowledge → prompt → generate
+(with explain running alongside) → feedback. `total` is wall time, so overlap shows up there.
+Gemini is replaced by a local fake client that returns canned JSON after an
+optional simulated round trip, Whisper by a canned transcript, and MusicGen by
+a tiny random-init model (or the real one with --music real). Feedback is written
+to a throwaway data directory.
+
+    python -m benchmarks.pipeline                                  # 20 sessions at concurrency 1 and 4
+    python -m benchmarks.pipeline --llm-latency-ms 800 --out after.json --compare before.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+
+STAGES = ["analyze", "knowledge", "prompt", "generate", "explain", "feedback"]
+
+
+# --- Offline stand-ins ---
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModels:
+    """Mimics client.models.generate_content, picking a canned reply from the prompt wording."""
+
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+
+    def generate_content(self, model, contents):
+        prompt = contents if isinstance(contents, str) else contents[0]
+        if self.latency_s:
+            time.sleep(self.latency_s * random.uniform(0.8, 1.2))
+        return _FakeResponse(_canned_reply(prompt))
+
+
+class _FakeAsyncModels:
+    """Mimics client.aio.models.generate_content; the round trip yields to the event loop."""
+
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+
+    async def generate_content(self, model, contents):
+        prompt = contents if isinstance(contents, str) else contents[0]
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s * random.uniform(0.8, 1.2))
+        return _FakeResponse(_canned_reply(prompt))
+
+
+class _FakeAio:
+    def __init__(self, latency_s):
+        self.models = _FakeAsyncModels(latency_s)
+
+
+class FakeGeminiClient:
+    def __init__(self, latency_s=0.0):
+        self.models = _FakeModels(latency_s)
+        self.aio = _FakeAio(latency_s)
+
+
+def _canned_reply(prompt):
+    moods = random.choice([
+        ["melancholic", "hopeful"], ["happy", "excited"], ["peaceful", "grateful"], ["anxious", "determined"],
+    ])
+    profile = {
+        "emotions": moods, "emotion": moods[0],
+        "energy": random.randint(10, 90), "style": random.randint(10, 90),
+        "warmth": random.randint(10, 90), "arc": random.randint(10, 90),
+    }
+    if '"sources"' in prompt:  # Combined analysis
+        sources = [s for s in ("text", "image", "voice") if f"\n- {s}:" in prompt]
+        return json.dumps({
+            "sources": {s: {"summary": "A canned summary", "caption": "A canned caption", "moods": moods,
+                            "mood": moods[0], "energy": round(random.random(), 2)} for s in sources},
+            "profile": profile,
+        })
+    if "unified emotional profile" in prompt:
+        return json.dumps(profile)
+    if "music director" in prompt:
+        return ("A slow, warm piano melody at 70 BPM with soft strings swelling underneath, "
+                "gentle brushed drums entering halfway and a hopeful major-key resolution.")
+    if "explaining to a user" in prompt:
+        return json.dumps({
+            "narrative": "Your words carried a quiet ache with a thread of hope, so the music starts soft and lifts.",
+            "key_descriptors": ["warm piano", "70 BPM", "soft strings", "gentle build"],
+        })
+    if "Analyze" in prompt:
+        return json.dumps({
+            "summary": "A canned summary", "caption": "A canned caption",
+            "moods": moods, "mood": moods[0], "energy": round(random.random(), 2),
+        })
+    if '"positive"' in prompt:
+        return json.dumps({"positive": ["Name specific instruments"], "negative": ["Avoid looping language"]})
+    if "preferred_params" in prompt:
+        return json.dumps({
+            "preferred_params": {"energy_range": [30, 60], "style_range": [30, 60],
+                                 "warmth_range": [40, 70], "arc_range": [20, 50]},
+            "prompt_principles": ["Lead with piano"], "anti_patterns": ["Avoid harsh synths"],
+            "best_prompt_template": "A slow {instrument} melody...",
+        })
+    return "{}"
+
+
+class _FakeWhisper:
+    def transcribe(self, audio, **kwargs):
+        return {"text": "I feel a little tired today but hopeful about tomorrow."}
+
+
+def _sample_image_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), (200, 120, 60)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _sample_voice_bytes():
+    import numpy as np
+    import scipy.io.wavfile
+    buf = io.BytesIO()
+    tone = (np.sin(np.arange(16000) * 2 * np.pi * 220 / 16000) * 8000).astype(np.int16)  # survives VAD
+    scipy.io.wavfile.write(buf, 16000, tone)
+    return buf.getvalue()
+
+
+def _install_stubs(args, data_dir):
+    """Point every external dependency at a local stand-in. Must run before sessions start."""
+    from utils import llm_client
+    from modules import (
+        feedback, feedback_stats, feedback_store, music_generator, prompt_index, reflection_worker, voice_analyzer,
+    )
+
+    llm_client._client = FakeGeminiClient(args.llm_latency_ms / 1000)
+    if not args.llm_cache:
+        llm_client.set_llm_cache(None)  # Every session re-sends the same canned inputs
+    voice_analyzer.STT_BACKEND = "whisper"
+    voice_analyzer._whisper_model = _FakeWhisper()
+
+    feedback_store.FEEDBACK_PATH = os.path.join(data_dir, "feedback.jsonl")
+    feedback_store.LEGACY_FEEDBACK_PATH = os.path.join(data_dir, "feedback.json")
+    feedback.LEARNED_RULES_PATH = os.path.join(data_dir, "learned_rules.json")
+    feedback_stats.STATS_PATH = os.path.join(data_dir, "feedback_stats.json")
+    prompt_index.PROMPT_INDEX_PATH = os.path.join(data_dir, "prompt_index.npz")
+    reflection_worker.REFLECTION_LOCK_PATH = os.path.join(data_dir, "reflection.lock")
+
+    if args.music == "tiny":
+        from benchmarks.tiny_model import TinyProcessor, build_tiny_musicgen
+        music_generator._processor = TinyProcessor()
+        music_generator._model = music_generator._apply_profile(build_tiny_musicgen())
+    elif args.music == "real":
+        music_generator._load_model()
+
+
+# --- Pipeline ---
+
+def _run_session(args, inputs):
+    """Run one Generate → Submit Feedback session with app.py's stage graph; return per-stage seconds."""
+    from modules.multimodal_analyzer import analyze_inputs
+    from modules.music_orchestrator import create_music_prompt, build_knowledge_context
+    from modules.music_generator import generate_music
+    from modules.explainer import explain_music
+    from modules.feedback import save_feedback
+    from modules.pipeline import stage, run_stages
+    from utils.llm_client import run_async
+
+    gen_params = {"max_new_tokens": args.tokens, "temperature": 1.0, "guidance_scale": 3.0}
+
+    given = {s: inputs[s] for s in args.sources}
+    stages = {"analyze": stage(lambda: run_async(analyze_inputs(
+        given.get("text"), given.get("image"), given.get("voice")
+    )))}
+    stages["profile"] = stage(lambda analyze: dict(analyze[1], overrides=[]), deps=["analyze"])
+    # Few-shot examples are picked by slider distance, so they follow the user's overrides
+    stages["knowledge"] = stage(lambda profile: build_knowledge_context(profile.get("emotion", "neutral"), profile),
+                                deps=["profile"])
+    stages["prompt"] = stage(lambda profile, knowledge: create_music_prompt(profile, knowledge),
+                             deps=["profile", "knowledge"])
+    if args.music != "skip":
+        stages["generate"] = stage(lambda prompt: generate_music(prompt, **gen_params), deps=["prompt"], inline=True)
+    stages["explain"] = stage(
+        lambda analyze, profile, prompt: explain_music(given.get("text", ""), analyze[1], profile, [], prompt),
+        deps=["analyze", "profile", "prompt"],
+    )
+
+    started = time.perf_counter()
+    results, stage_timings = run_stages(stages)
+    generation_wall = time.perf_counter() - started
+
+    feedback_started = time.perf_counter()
+    save_feedback(
+        rating=random.randint(1, 5), would_replay=random.random() > 0.5,
+        ai_profile=results["analyze"][1], final_profile=results["profile"], music_prompt=results["prompt"],
+        preferred_version=random.choice(["A", "B", "No preference"]), gen_params=gen_params,
+    )
+
+    timings = {"feedback": time.perf_counter() - feedback_started}
+    for name in ("analyze", "knowledge", "prompt", "generate", "explain"):
+        if name in stage_timings:
+            timings[name] = stage_timings[name]["duration"]
+    timings["total"] = generation_wall + timings["feedback"]
+    return timings
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 1),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+    }
+
+
+def _run_level(args, inputs, concurrency):
+    """Run args.sessions sessions with `concurrency` in flight; return throughput and stage stats."""
+    samples = {stage: [] for stage in STAGES + ["total"]}
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(_run_session, args, inputs) for _ in range(args.sessions)]
+        for future in as_completed(futures):
+            try:
+                timings = future.result()
+            except Exception as exc:
+                errors += 1
+                print(f"  session failed: {exc!r}", file=sys.stderr)
+                continue
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "sessions": args.sessions,
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "sessions_per_min": round((args.sessions - errors) / wall * 60, 1),
+        "stages": {stage: _percentiles(v) for stage, v in samples.items() if v},
+    }
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _print_level(level):
+    print(f"\nconcurrency {level['concurrency']}: {level['sessions_per_min']} sessions/min "
+          f"({level['wall_s']}s wall, {level['errors']} errors)")
+    print(f"  {'stage':<10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for stage, stats in level["stages"].items():
+        print(f"  {stage:<10}{stats['p50_ms']:>10}{stats['p90_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def _print_comparison(current, baseline_path):
+    """Print p50 change per stage against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {lvl["concurrency"]: lvl for lvl in baseline.get("levels", [])}
+    print(f"\nvs {baseline_path}:")
+    for level in current["levels"]:
+        old = before.get(level["concurrency"])
+        if not old:
+            continue
+        print(f"  concurrency {level['concurrency']}: "
+              f"{old['sessions_per_min']} → {level['sessions_per_min']} sessions/min")
+        for stage, stats in level["stages"].items():
+            prev = old["stages"].get(stage)
+            if prev and prev["p50_ms"]:
+                change = (stats["p50_ms"] - prev["p50_ms"]) / prev["p50_ms"] * 100
+                print(f"    {stage:<10}{prev['p50_ms']:>10} → {stats['p50_ms']:<10} ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="sessions per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sources", nargs="+", default=["text", "image", "voice"],
+                        choices=["text", "image", "voice"])
+    parser.add_argument("--music", choices=["tiny", "real", "skip"], default="tiny",
+                        help="tiny random-init MusicGen (default), the real HF_MODEL_ID, or skip generation")
+    parser.add_argument("--tokens", type=int, default=50, help="max_new_tokens per generation")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="simulated Gemini round trip")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the Gemini response cache on (LLM_CACHE)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="previous --out file to diff against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    inputs = {
+        "text": "I'm tired after a long week but hopeful about the weekend",
+        "image": _sample_image_bytes(),
+        "voice": _sample_voice_bytes(),
+    }
+
+    with tempfile.TemporaryDirectory(prefix="m2me-bench-") as data_dir:
+        _install_stubs(args, data_dir)
+        results = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "levels": [],
+        }
+        for concurrency in args.concurrency:
+            level = _run_level(args, inputs, concurrency)
+            results["levels"].append(level)
+            _print_level(level)
+        results["peak_rss_mb"] = _peak_rss_mb()
+
+        # Reflection runs off the feedback path; let it finish before the data dir goes away
+        from modules.reflection_worker import get_reflection_status, wait_idle
+        wait_idle()
+        results["reflection"] = get_reflection_status()
+
+    print(f"\npeak RSS: {results['peak_rss_mb']} MB")
+    print(f"background reflections: {results['reflection']['runs']} "
+          f"(last took {results['reflection']['last_duration_s']}s)")
+    if args.compare:
+        _print_comparison(results, args.compare)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
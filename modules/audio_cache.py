@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "audio_cache")
+CACHE_MAX_MB = float(os.getenv("MUSICGEN_CACHE_MAX_MB", "500"))
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def cache_key(model_id, prompt, num_variations, params):
+    """Hash everything that determines the generated audio into a stable key."""
+    payload = json.dumps(
+        {"model": model_id, "prompt": prompt, "num_variations": num_variations, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key):
+    return os.path.join(os.path.abspath(CACHE_DIR), key)
+
+
+def get_cached(key):
+    """Return the cached list of WAV byte buffers for key, or None on a miss."""
+    path = _entry_dir(key)
+    try:
+        names = sorted(n for n in os.listdir(path) if n.endswith(".wav"))
+        audio = []
+        for name in names:
+            with open(os.path.join(path, name), "rb") as f:
+                audio.append(f.read())
+        os.utime(path)  # Mark as recently used for LRU eviction
+    except OSError:
+        audio = None
+
+    with _lock:
+        _stats["hits" if audio else "misses"] += 1
+    return audio or None
+
+
+def put_cached(key, audio_list):
+    """Store WAV buffers under key, then evict least-recently-used entries over the size cap."""
+    root = os.path.abspath(CACHE_DIR)
+    os.makedirs(root, exist_ok=True)
+
+    # Write into a scratch dir and rename, so readers never see a half-written entry
+    tmp = tempfile.mkdtemp(dir=root, prefix=".tmp-")
+    for i, audio in enumerate(audio_list):
+        with open(os.path.join(tmp, f"{i}.wav"), "wb") as f:
+            f.write(audio)
+    try:
+        os.rename(tmp, _entry_dir(key))
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # Another session cached it first
+
+    _evict(root)
+
+
+def _evict(root):
+    """Delete the oldest entries until the cache fits in CACHE_MAX_MB."""
+    entries = []
+    total = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        except OSError:
+            continue  # Evicted concurrently
+        total += size
+
+    limit = CACHE_MAX_MB * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        with _lock:
+            _stats["evictions"] += 1
+
+
+def get_cache_stats():
+    """Return hit/miss/eviction counters for this process plus the hit rate."""
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
@@ -1,5 +1,20 @@
-from utils.llm_client import ask_json
+import asyncio
+import os
+import numpy as np
+from utils.llm_client import ask_json, ask_json_async
 from modules.feedback import get_learned_defaults, get_emotion_profile
+from modules.emotion_vocab import EMOTION_LEXICON, canonical_emotion
+
+FUSION_MODE = os.getenv("FUSION_MODE", "hybrid")  # local | hybrid | llm
+
+DIMENSIONS = ["energy", "style", "warmth", "arc"]
+
+RANK_WEIGHTS = [1.0, 0.6, 0.35]  # 1st, 2nd, 3rd mood of a source
+SOURCE_WEIGHTS = {"text": 1.0, "voice": 1.0, "image": 0.8}
+MEASURED_ENERGY_WEIGHT = 0.5  # Share of fused energy taken from the analyzers' own energy scores
+
+_LEXICON_INDEX = {word: i for i, word in enumerate(EMOTION_LEXICON)}
+_LEXICON_VECTORS = np.array(list(EMOTION_LEXICON.values()), dtype=np.float64)
 
 
 def _range_clamp(ai_value, learned_range):
@@ -16,51 +31,53 @@ def _range_clamp(ai_value, learned_range):
     return round(ai_value * 0.3 + nearest * 0.7)
 
 
-def fuse_emotions(mood_list):
-    """Merge mood signals into one ai_profile with 4 slider dimensions."""
-    sources = [m.get("source", "unknown") for m in mood_list]
-
-    mood_descriptions = "\n".join(
-        f"- Source: {m.get('source')}, Moods: {m.get('moods', [m.get('mood')])}, Energy: {m.get('energy')}"
-        for m in mood_list
-    )
-
-    prompt = f"""You are an emotion analyst for a music generation system.
-
-Given these mood signals from user inputs:
-{mood_descriptions}
-
-Produce ONE unified emotional profile as JSON:
-{{
+PROFILE_SCHEMA = """{
   "emotions": ["<list of 1-3 detected emotions, most dominant first>"],
   "emotion": "<single most dominant emotion>",
   "energy": <0-100 integer>,
   "style": <0-100 integer, 0=minimal sparse, 100=cinematic epic>,
   "warmth": <0-100 integer, 0=deep dark moody, 100=bright sparkling>,
   "arc": <0-100 integer, 0=steady constant, 100=big dramatic build>
-}}
+}"""
 
-Rules:
+FUSION_RULES = """Rules:
 - Blend ALL detected emotions into the slider values, not just the dominant one
 - "sad but hopeful" → moderate energy (hope lifts it), warm style, gentle build arc
 - "angry and frustrated" → high energy, bright/harsh warmth, big build
 - "peaceful and grateful" → low energy, warm, steady arc
 - The slider values should reflect the MIX of emotions, not just the dominant one
-- Base values on the actual emotional content, not random guesses
+- Base values on the actual emotional content, not random guesses"""
+
+
+def _build_prompt(mood_list):
+    mood_descriptions = "\n".join(
+        f"- Source: {m.get('source')}, Moods: {m.get('moods', [m.get('mood')])}, Energy: {m.get('energy')}"
+        for m in mood_list
+    )
+
+    return f"""You are an emotion analyst for a music generation system.
+
+Given these mood signals from user inputs:
+{mood_descriptions}
+
+Produce ONE unified emotional profile as JSON:
+{PROFILE_SCHEMA}
+
+{FUSION_RULES}
 
 Return ONLY the JSON object."""
 
-    result = ask_json(prompt)
-    result["sources"] = sources
 
-    # Apply learned knowledge — range-clamping instead of blind overwrite
+def apply_learned_knowledge(result):
+    """Pull a fused profile's slider values toward what users rated well for its emotion."""
+    # Range-clamping instead of blind overwrite
     emotion = result.get("emotion", "")
     emo_profile = get_emotion_profile(emotion)
 
     if emo_profile:
         # Use range-clamping: keep AI value if in range, nudge if outside
         pref = emo_profile.get("preferred_params", {})
-        for key in ["energy", "style", "warmth", "arc"]:
+        for key in DIMENSIONS:
             range_key = f"{key}_range"
             if range_key in pref and key in result:
                 result[key] = _range_clamp(result[key], pref[range_key])
@@ -68,8 +85,86 @@ Return ONLY the JSON object."""
         # Fallback: simple averaging with learned defaults
         learned = get_learned_defaults(emotion)
         if learned:
-            for key in ["energy", "style", "warmth", "arc"]:
+            for key in DIMENSIONS:
                 if key in learned and key in result:
                     result[key] = round((result[key] + learned[key]) / 2)
 
     return result
+
+
+def fuse_locally(mood_list):
+    """Blend mood signals with the emotion lexicon. Returns (profile, unknown_words).
+
+    Each mood word is weighted by its source and its rank within that source;
+    slider values are the weighted mean of the known words' lexicon vectors, with
+    energy pulled toward the analyzers' measured energy.
+    """
+    words, weights, energies, energy_weights = [], [], [], []
+    for m in mood_list:
+        source_weight = SOURCE_WEIGHTS.get(m.get("source"), 1.0)
+        moods = m.get("moods") or [m.get("mood") or "neutral"]
+        for rank, mood in enumerate(moods[:len(RANK_WEIGHTS)]):
+            words.append(canonical_emotion(str(mood)))
+            weights.append(source_weight * RANK_WEIGHTS[rank])
+        if isinstance(m.get("energy"), (int, float)):
+            energies.append(m["energy"] * 100)
+            energy_weights.append(source_weight)
+
+    weights = np.array(weights)
+    known = np.array([w in _LEXICON_INDEX for w in words], dtype=bool)
+    unknown = sorted({w for w, k in zip(words, known) if not k})
+
+    if known.any():
+        idx = np.array([_LEXICON_INDEX[w] for w, k in zip(words, known) if k])
+        vector = weights[known] @ _LEXICON_VECTORS[idx] / weights[known].sum()
+    else:
+        vector = _LEXICON_VECTORS[_LEXICON_INDEX["neutral"]].copy()
+    if energies:
+        measured = np.average(energies, weights=energy_weights)
+        vector[0] = (1 - MEASURED_ENERGY_WEIGHT) * vector[0] + MEASURED_ENERGY_WEIGHT * measured
+
+    # Rank emotions by total weight across sources (unknown words still name the mood)
+    totals = {}
+    for word, weight in zip(words, weights):
+        totals[word] = totals.get(word, 0.0) + weight
+    emotions = sorted(totals, key=totals.get, reverse=True)[:3]
+
+    profile = {"emotions": emotions, "emotion": emotions[0]}
+    profile.update({key: int(round(v)) for key, v in zip(DIMENSIONS, np.clip(vector, 0, 100))})
+    return profile, unknown
+
+
+def try_local_fusion(mood_list):
+    """Fuse without Gemini when FUSION_MODE allows it; None means ask the LLM."""
+    if FUSION_MODE == "llm":
+        return None
+    if FUSION_MODE not in ("local", "hybrid"):
+        raise RuntimeError(f"Unknown FUSION_MODE '{FUSION_MODE}' (choose from local, hybrid, llm)")
+    profile, unknown = fuse_locally(mood_list)
+    if unknown and FUSION_MODE == "hybrid":
+        return None
+    profile["sources"] = [m.get("source", "unknown") for m in mood_list]
+    return profile
+
+
+def fuse_emotions(mood_list):
+    """Merge mood signals into one ai_profile with 4 slider dimensions."""
+    result = try_local_fusion(mood_list)
+    if result is not None:
+        return apply_learned_knowledge(result)
+
+    result = ask_json(_build_prompt(mood_list))
+    result["sources"] = [m.get("source", "unknown") for m in mood_list]
+    return apply_learned_knowledge(result)
+
+
+async def fuse_emotions_async(mood_list):
+    """Async fuse_emotions. Learned-knowledge lookups read the feedback files, so they run
+    in a worker thread rather than on the shared Gemini event loop."""
+    result = await asyncio.to_thread(try_local_fusion, mood_list)
+    if result is not None:
+        return await asyncio.to_thread(apply_learned_knowledge, result)
+
+    result = await ask_json_async(_build_prompt(mood_list))
+    result["sources"] = [m.get("source", "unknown") for m in mood_list]
+    return await asyncio.to_thread(apply_learned_knowledge, result)
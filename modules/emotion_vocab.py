@@ -0,0 +1,172 @@
+import os
+import re
+import zlib
+from functools import lru_cache
+import numpy as np
+
+EMOTION_MATCH_THRESHOLD = float(os.getenv("EMOTION_MATCH_THRESHOLD", "0.75"))  # fuzzy match cosine; 1 disables
+
+# Bump whenever the tables below change, so stored aggregates are rebuilt under the new buckets
+VOCAB_VERSION = 2
+
+# Canonical emotions, and where each sits on the four sliders (0-100): energy, style, warmth, arc
+EMOTION_LEXICON = {
+    "happy": (70, 50, 80, 45),
+    "joyful": (80, 55, 85, 55),
+    "excited": (90, 65, 80, 70),
+    "euphoric": (95, 75, 90, 75),
+    "elated": (88, 65, 88, 65),
+    "energetic": (90, 55, 75, 60),
+    "playful": (65, 40, 85, 40),
+    "whimsical": (55, 45, 80, 40),
+    "content": (40, 35, 70, 20),
+    "relieved": (35, 35, 70, 30),
+    "peaceful": (20, 30, 60, 10),
+    "calm": (20, 25, 55, 10),
+    "serene": (18, 35, 65, 12),
+    "relaxed": (25, 25, 62, 12),
+    "dreamy": (30, 50, 60, 30),
+    "grateful": (35, 45, 75, 35),
+    "hopeful": (50, 55, 72, 60),
+    "optimistic": (60, 50, 78, 50),
+    "inspired": (65, 75, 75, 75),
+    "awe": (55, 90, 65, 80),
+    "loving": (40, 50, 80, 40),
+    "romantic": (40, 55, 72, 45),
+    "tender": (25, 35, 72, 25),
+    "confident": (70, 60, 70, 55),
+    "proud": (70, 70, 75, 65),
+    "triumphant": (85, 90, 80, 85),
+    "empowered": (80, 75, 70, 75),
+    "determined": (75, 65, 60, 70),
+    "curious": (50, 45, 65, 45),
+    "surprised": (70, 55, 70, 60),
+    "neutral": (50, 50, 50, 30),
+    "reflective": (30, 35, 45, 25),
+    "contemplative": (28, 35, 42, 22),
+    "thoughtful": (30, 35, 48, 25),
+    "nostalgic": (35, 45, 55, 35),
+    "bittersweet": (35, 50, 45, 40),
+    "longing": (35, 50, 40, 45),
+    "mysterious": (40, 60, 25, 50),
+    "confused": (50, 40, 45, 40),
+    "bored": (20, 15, 45, 5),
+    "tired": (15, 20, 40, 10),
+    "melancholic": (28, 45, 30, 30),
+    "sad": (25, 40, 25, 30),
+    "gloomy": (25, 45, 15, 25),
+    "lonely": (20, 25, 25, 20),
+    "hurt": (30, 40, 25, 35),
+    "heartbroken": (25, 50, 20, 40),
+    "sorrowful": (22, 50, 20, 35),
+    "grieving": (25, 60, 18, 45),
+    "despair": (20, 55, 10, 40),
+    "anxious": (65, 45, 35, 55),
+    "nervous": (60, 40, 40, 50),
+    "tense": (68, 55, 30, 60),
+    "stressed": (70, 50, 35, 55),
+    "overwhelmed": (75, 70, 35, 70),
+    "fearful": (70, 60, 20, 65),
+    "scared": (72, 60, 20, 65),
+    "frustrated": (75, 50, 40, 60),
+    "angry": (88, 60, 45, 70),
+    "furious": (95, 70, 45, 80),
+}
+
+# Other words for the canonical emotions above
+SYNONYMS = {
+    "happiness": "happy", "glad": "happy", "cheerful": "happy", "upbeat": "happy", "delighted": "joyful",
+    "joy": "joyful", "jubilant": "joyful", "blissful": "euphoric", "ecstatic": "euphoric", "thrilled": "excited",
+    "exhilarated": "excited", "enthusiastic": "excited", "eager": "excited", "lively": "energetic",
+    "pumped": "energetic", "fun": "playful", "silly": "playful", "mischievous": "playful", "quirky": "whimsical",
+    "satisfied": "content", "comfortable": "content", "cozy": "content", "at ease": "relaxed", "chill": "relaxed",
+    "laid-back": "relaxed", "tranquil": "serene", "still": "calm", "quiet": "calm", "placid": "calm",
+    "peace": "peaceful", "restful": "peaceful", "soothed": "peaceful", "ethereal": "dreamy", "hazy": "dreamy",
+    "thankful": "grateful", "appreciative": "grateful", "hope": "hopeful", "uplifted": "hopeful",
+    "encouraged": "hopeful", "positive": "optimistic", "motivated": "inspired", "creative": "inspired",
+    "awed": "awe", "awestruck": "awe", "amazed": "awe", "wonder": "awe", "in love": "loving",
+    "affectionate": "loving", "warm": "loving", "caring": "tender", "gentle": "tender", "passionate": "romantic",
+    "self-assured": "confident", "bold": "confident", "accomplished": "proud", "victorious": "triumphant",
+    "powerful": "empowered", "strong": "empowered", "focused": "determined", "resolute": "determined",
+    "driven": "determined", "interested": "curious", "intrigued": "curious", "shocked": "surprised",
+    "astonished": "surprised", "calmness": "calm", "indifferent": "neutral", "meh": "neutral",
+    "pensive": "reflective", "introspective": "reflective", "meditative": "contemplative",
+    "wistful": "melancholic", "melancholy": "melancholic", "blue": "sad", "down": "sad", "unhappy": "sad",
+    "sadness": "sad", "depressed": "sad", "downcast": "sad", "somber": "gloomy", "sombre": "gloomy",
+    "dark": "gloomy", "bleak": "gloomy", "isolated": "lonely", "alone": "lonely", "lonesome": "lonely",
+    "heartbreak": "heartbroken", "devastated": "heartbroken", "grief": "grieving", "mournful": "grieving",
+    "mourning": "grieving", "sorrow": "sorrowful", "hopeless": "despair", "desperate": "despair",
+    "yearning": "longing", "missing": "longing", "homesick": "nostalgic", "sentimental": "nostalgic",
+    "enigmatic": "mysterious", "eerie": "mysterious", "puzzled": "confused", "uncertain": "confused",
+    "lost": "confused", "weary": "tired", "exhausted": "tired", "drained": "tired", "sleepy": "tired",
+    "fatigued": "tired", "apathetic": "bored", "anxiety": "anxious", "worried": "anxious",
+    "uneasy": "anxious", "jittery": "nervous", "on edge": "tense", "stress": "stressed", "pressured": "stressed",
+    "frazzled": "overwhelmed", "afraid": "scared", "frightened": "scared", "terrified": "fearful",
+    "fear": "fearful", "annoyed": "frustrated", "irritated": "frustrated", "agitated": "frustrated",
+    "anger": "angry", "mad": "angry", "resentful": "angry", "enraged": "furious", "rage": "furious",
+    "hurting": "hurt", "wounded": "hurt", "betrayed": "hurt",
+    "excitement": "excited", "nervousness": "nervous", "loneliness": "lonely", "gratitude": "grateful",
+    "curiosity": "curious", "confusion": "confused", "tiredness": "tired", "boredom": "bored",
+    "serenity": "serene", "nostalgia": "nostalgic", "contentment": "content", "pride": "proud",
+    "frustration": "frustrated", "despairing": "despair", "melancholia": "melancholic",
+    # Negated forms, mapped to what they mean; fuzzy matching never pairs them with their opposite
+    "uninspired": "bored", "unmotivated": "bored", "dissatisfied": "frustrated", "unsatisfied": "frustrated",
+    "insecure": "anxious", "unsettled": "anxious", "discouraged": "despair", "disheartened": "despair",
+    "unloved": "lonely", "unwanted": "lonely", "helpless": "overwhelmed", "powerless": "overwhelmed",
+    "restless": "bored",
+}
+
+_VOCAB = {word: word for word in EMOTION_LEXICON}
+_VOCAB.update(SYNONYMS)
+_NGRAM_DIMS = 2048
+_NEGATING_PREFIXES = ("un", "dis", "in", "im", "non")
+
+
+def _normalize(word):
+    return re.sub(r"[^a-z\- ]+", "", word.strip().lower()).strip()
+
+
+def _ngram_vector(word):
+    """Hashed character-trigram vector, L2-normalized; catches spelling and inflection variants."""
+    padded = f"^{word}$"
+    vec = np.zeros(_NGRAM_DIMS)
+    for i in range(len(padded) - 2):
+        vec[zlib.crc32(padded[i:i + 3].encode("utf-8")) % _NGRAM_DIMS] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _negations(word):
+    """Negating affixes on a word ("un", "dis", ..., "-less"), compared so a fuzzy match can't flip its meaning."""
+    found = {prefix for prefix in _NEGATING_PREFIXES if word.startswith(prefix)}
+    if word.endswith("less"):
+        found.add("less")
+    return found
+
+
+# Precomputed once: one row per known word (canonical emotions and synonyms)
+_VOCAB_WORDS = list(_VOCAB)
+_VOCAB_MATRIX = np.stack([_ngram_vector(w) for w in _VOCAB_WORDS])
+
+
+@lru_cache(maxsize=4096)
+def canonical_emotion(word):
+    """Map a mood word to its canonical emotion.
+
+    Exact matches and synonyms map directly; otherwise the nearest known word
+    by character-trigram similarity is used if it is close enough (e.g.
+    "melancolic" → "melancholic") and carries the same negating affixes, so
+    "uninspired" never lands on "inspired". Anything else comes back normalized
+    but unchanged, so new emotions still get their own bucket.
+    """
+    word = _normalize(word or "")
+    if not word or word in _VOCAB:
+        return _VOCAB.get(word, word)
+    scores = _VOCAB_MATRIX @ _ngram_vector(word)
+    negations = _negations(word)
+    for i in np.argsort(-scores):
+        if scores[i] < EMOTION_MATCH_THRESHOLD:
+            break
+        if _negations(_VOCAB_WORDS[i]) == negations:
+            return _VOCAB[_VOCAB_WORDS[i]]
+    return word
@@ -1,12 +1,28 @@
+import asyncio
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from utils.llm_client import ask_json
+from types import MappingProxyType
+from utils.llm_client import ask_json_async, run_async
+from modules.feedback_store import append_entry, load_entries, count_entries, find_entries
+from modules.reflection_worker import request_reflection, get_reflection_status
+from modules.emotion_vocab import canonical_emotion, VOCAB_VERSION
+from modules.prompt_index import update as update_prompt_index, nearest_prompts
+from modules.feedback_stats import (
+    update as update_stats, get_emotion_stats, get_emotions, get_param_insights, get_learned_ranges,
+)
 
-FEEDBACK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "feedback.json")
 LEARNED_RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "learned_rules.json")
 
 REFLECTION_THRESHOLD = 5  # Run reflection every N new ratings
+MAX_RATING = 5
+# Gemini calls in flight per reflection; kept below LLM_MAX_CONCURRENCY (8) so background
+# reflection never takes every slot from interactive sessions
+REFLECTION_CONCURRENCY = int(os.getenv("REFLECTION_CONCURRENCY", "4"))
+LEARNED_RANGES = os.getenv("LEARNED_RANGES", "local")  # local (statistical estimate) | llm (Phase B reflection)
+REFLECTION_FULL_EVERY = int(os.getenv("REFLECTION_FULL_EVERY", "0"))  # Rebuild from all entries every N cycles; 0 = never
 
 _DEFAULT_RULES = {
     "version": 1,
@@ -27,43 +43,83 @@ _DEFAULT_RULES = {
 # --- Feedback I/O ---
 
 def _load_feedback():
-    """Load all feedback entries from disk."""
-    path = os.path.abspath(FEEDBACK_PATH)
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        return json.load(f)
+    """Load all feedback entries (see feedback_store for the on-disk log)."""
+    return load_entries()
 
 
-def _save_feedback(entries):
-    """Write all feedback entries to disk."""
-    path = os.path.abspath(FEEDBACK_PATH)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(entries, f, indent=2)
+# --- Learned Rules I/O ---
 
+# Parsed learned_rules.json, shared by every reader until the file changes
+_rules_snapshot = None  # (file signature, frozen rules)
+_rules_lock = threading.Lock()
+
+
+def _freeze(value):
+    """Read-only view: dicts become MappingProxyType, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
-# --- Learned Rules I/O ---
 
 def _load_learned_rules():
-    """Load learned rules from disk, returning defaults if missing."""
+    """Return the learned rules as a read-only snapshot, re-parsed only when the file changes."""
+    global _rules_snapshot
     path = os.path.abspath(LEARNED_RULES_PATH)
-    if not os.path.exists(path):
-        return dict(_DEFAULT_RULES)
-    with open(path, "r") as f:
-        return json.load(f)
+    signature = _file_signature(path)
+    snapshot = _rules_snapshot
+    if snapshot is not None and snapshot[0] == signature:
+        return snapshot[1]
+
+    with _rules_lock:
+        if signature is None:
+            rules = _DEFAULT_RULES
+        else:
+            with open(path, "r") as f:
+                rules = json.load(f)
+        frozen = _freeze(rules)
+        _rules_snapshot = (signature, frozen)
+    return frozen
+
+
+def _load_learned_rules_for_update():
+    """Mutable deep copy of the learned rules, for reflection to edit and save."""
+    return _thaw(_load_learned_rules())
 
 
 def _save_learned_rules(rules):
-    """Write learned rules to disk."""
+    """Write learned rules to disk atomically and refresh the in-process snapshot."""
+    global _rules_snapshot
     path = os.path.abspath(LEARNED_RULES_PATH)
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w") as f:
         json.dump(rules, f, indent=2)
+    os.replace(tmp, path)  # Readers in other processes never see a half-written file
+
+    with _rules_lock:
+        _rules_snapshot = (_file_signature(path), _freeze(rules))
 
 
 def get_learned_rules():
-    """Public accessor for the full knowledge base."""
+    """Public accessor for the full knowledge base (read-only; see _load_learned_rules)."""
     return _load_learned_rules()
 
 
@@ -71,8 +127,7 @@ def get_learned_rules():
 
 def save_feedback(rating, would_replay, ai_profile, final_profile, music_prompt,
                   preferred_version="N/A", gen_params=None, user_note=None):
-    """Append a feedback entry, then maybe trigger reflection."""
-    entries = _load_feedback()
+    """Append a feedback entry, then maybe queue a background reflection."""
     entry = {
         "timestamp": datetime.now().isoformat(),
         "rating": rating,
@@ -86,31 +141,42 @@ def save_feedback(rating, would_replay, ai_profile, final_profile, music_prompt,
         entry["gen_params"] = gen_params
     if user_note:
         entry["user_note"] = user_note
-    entries.append(entry)
-    _save_feedback(entries)
+    append_entry(entry)
+    update_stats()
+    update_prompt_index()
 
     # Check if we should run a reflection cycle
-    _maybe_trigger_reflection(entries)
+    _maybe_trigger_reflection(count_entries())
 
 
 def get_negative_examples(emotion, max_rating=2, limit=3):
     """Return prompts from low-rated sessions — used as 'avoid this' guidance."""
-    entries = _load_feedback()
-    bad = [
-        e for e in entries
-        if e.get("rating", 5) <= max_rating
-        and e.get("final_profile", {}).get("emotion", "").lower() == emotion.lower()
-        and e.get("music_prompt")
-    ]
-    bad.sort(key=lambda e: (e.get("rating", 5), e.get("timestamp", "")))
-    return [e["music_prompt"] for e in bad[:limit]]
+    bad = find_entries(emotion, range(1, max_rating + 1), where=lambda e: e.get("music_prompt"), limit=limit)
+    return [e["music_prompt"] for e in bad]
 
 
 def get_emotion_profile(emotion):
-    """Return per-emotion learned data from rules file, or None."""
+    """Return per-emotion learned data from rules file, or None.
+
+    With LEARNED_RANGES=local, preferred_params come from the statistical range
+    estimate, which is current as of the latest rating, rather than from reflection.
+    """
     rules = _load_learned_rules()
     profiles = rules.get("emotion_profiles", {})
-    return profiles.get(emotion.lower())
+    canonical = canonical_emotion(emotion)
+    # Profiles learned before the vocabulary existed may still sit under the raw word
+    profile = profiles.get(canonical) or profiles.get(emotion.lower())
+    if LEARNED_RANGES != "local":
+        return profile
+
+    ranges = get_learned_ranges().get(canonical)
+    if ranges is None:
+        return profile
+    merged = dict(profile or {})
+    merged["preferred_params"] = MappingProxyType(
+        {f"{key}_range": tuple(ranges[f"{key}_range"]) for key in ["energy", "style", "warmth", "arc"]}
+    )
+    return MappingProxyType(merged)
 
 
 def get_optimal_gen_params():
@@ -142,37 +208,25 @@ def get_learned_defaults(emotion):
         if result:
             return result
 
-    # Fallback: average high-rated sessions
-    entries = _load_feedback()
-    good = [
-        e for e in entries
-        if e.get("rating", 0) >= 4
-        and e.get("final_profile", {}).get("emotion", "").lower() == emotion.lower()
-    ]
+    # Fallback: average high-rated sessions (from the running aggregates)
+    good = get_emotion_stats(emotion, min_rating=4, percentiles=False)
 
-    if len(good) < 2:
+    if not good or good["sessions"] < 2:
         return None
 
-    result = {}
-    for key in ["energy", "style", "warmth", "arc"]:
-        values = [e["final_profile"][key] for e in good if key in e.get("final_profile", {})]
-        if values:
-            result[key] = round(sum(values) / len(values))
-
-    return result
+    return {key: round(good[key]["mean"]) for key in ["energy", "style", "warmth", "arc"] if key in good}
 
 
 def get_top_prompts(emotion, min_rating=4, limit=3):
     """Return music prompts from high-rated sessions with similar emotion."""
-    entries = _load_feedback()
-    good = [
-        e for e in entries
-        if e.get("rating", 0) >= min_rating
-        and e.get("final_profile", {}).get("emotion", "").lower() == emotion.lower()
-        and e.get("music_prompt")
-    ]
-    good.sort(key=lambda e: (e.get("rating", 0), e.get("timestamp", "")), reverse=True)
-    return [e["music_prompt"] for e in good[:limit]]
+    good = find_entries(emotion, range(MAX_RATING, min_rating - 1, -1), newest_first=True,
+                        where=lambda e: e.get("music_prompt"), limit=limit)
+    return [e["music_prompt"] for e in good]
+
+
+def get_similar_prompts(profile, min_rating=4, limit=3):
+    """Return music prompts from high-rated sessions nearest to this profile's emotion and sliders."""
+    return nearest_prompts(profile, k=limit, min_rating=min_rating)
 
 
 def get_feedback_summary():
@@ -197,6 +251,8 @@ def get_feedback_summary():
         "rules_active": len(rules.get("global_rules", {}).get("positive", []))
                       + len(rules.get("global_rules", {}).get("negative", [])),
         "next_reflection_in": max(0, REFLECTION_THRESHOLD - entries_since),
+        "reflection": get_reflection_status(),
+        "last_reflection_metrics": rules.get("reflection_metrics"),
     }
 
 
@@ -218,12 +274,15 @@ def _format_entries_for_reflection(entries):
     return "\n".join(lines)
 
 
-def _format_slider_ranges(entries):
-    """Summarize slider value distributions from entries."""
+def _format_slider_ranges(entries=None):
+    """Summarize slider value distributions from entries, or from the running aggregates for all feedback."""
+    if entries is None:
+        return _format_slider_stats()
+
     by_emotion = {}
     for e in entries:
         fp = e.get("final_profile", {})
-        emotion = fp.get("emotion", "unknown").lower()
+        emotion = canonical_emotion(fp.get("emotion", "unknown"))
         if emotion not in by_emotion:
             by_emotion[emotion] = {"energy": [], "style": [], "warmth": [], "arc": [], "ratings": []}
         for key in ["energy", "style", "warmth", "arc"]:
@@ -243,59 +302,42 @@ def _format_slider_ranges(entries):
     return "\n".join(lines)
 
 
-def _compute_param_insights(entries):
-    """Correlate MusicGen gen_params with ratings."""
-    with_params = [e for e in entries if e.get("gen_params")]
-    if not with_params:
-        return None
-
-    # Group by rating bucket
-    high = [e for e in with_params if e.get("rating", 0) >= 4]
-    low = [e for e in with_params if e.get("rating", 0) <= 2]
+def _format_slider_stats():
+    lines = []
+    for emotion in get_emotions():
+        stats = get_emotion_stats(emotion)
+        parts = [
+            f"{key}: {stats[key]['min']}-{stats[key]['max']} (avg {round(stats[key]['mean'])}, "
+            f"middle 80% {stats[key]['p10']}-{stats[key]['p90']})"
+            for key in ["energy", "style", "warmth", "arc"] if key in stats
+        ]
+        lines.append(f"{emotion} ({stats['sessions']} sessions, avg rating {stats['avg_rating']}): {', '.join(parts)}")
+    return "\n".join(lines)
 
-    def avg_param(group, key, default):
-        vals = [e["gen_params"].get(key, default) for e in group]
-        return round(sum(vals) / len(vals), 2) if vals else default
 
-    return {
-        "best_temperature": avg_param(high, "temperature", 1.0) if high else 1.0,
-        "best_guidance_scale": avg_param(high, "guidance_scale", 3.0) if high else 3.0,
-        "best_max_new_tokens": round(avg_param(high, "max_new_tokens", 256)) if high else 256,
-        "param_history": [
-            {"rating": e.get("rating"), "params": e.get("gen_params")}
-            for e in with_params[-10:]  # Keep last 10
-        ],
-    }
+def _reflection_due(entry_count):
+    rules = _load_learned_rules()
+    return entry_count - rules.get("entries_analyzed", 0) >= REFLECTION_THRESHOLD
 
 
-def _maybe_trigger_reflection(entries):
-    """Gate reflection to run every REFLECTION_THRESHOLD new ratings."""
-    rules = _load_learned_rules()
-    entries_since = len(entries) - rules.get("entries_analyzed", 0)
-    if entries_since >= REFLECTION_THRESHOLD:
-        run_reflection()
+def _maybe_trigger_reflection(entry_count):
+    """Gate reflection to run every REFLECTION_THRESHOLD new ratings, off the request path."""
+    if _reflection_due(entry_count):
+        request_reflection(_reflect_if_due)
 
 
-def run_reflection():
-    """Core batch learning: analyze feedback to extract reusable rules.
+def _reflect_if_due():
+    # Re-check once the worker holds the lock: a run that just finished may have covered us
+    if _reflection_due(count_entries()):
+        run_reflection()
 
-    Phase A: Global rules from high vs. low-rated prompts
-    Phase B: Per-emotion analysis
-    Phase C: Parameter correlation
-    """
-    entries = _load_feedback()
-    if len(entries) < REFLECTION_THRESHOLD:
-        return
 
-    rules = _load_learned_rules()
+def _phase_a_prompt(entries):
     formatted = _format_entries_for_reflection(entries)
-    slider_summary = _format_slider_ranges(entries)
-
     high = [e for e in entries if e.get("rating", 0) >= 4]
     low = [e for e in entries if e.get("rating", 0) <= 2]
 
-    # --- Phase A: Global rules ---
-    phase_a_prompt = f"""You are a music AI trainer analyzing user feedback on AI-generated music.
+    return f"""You are a music AI trainer analyzing user feedback on AI-generated music.
 
 Here are all feedback entries (rating 1-5, with the prompt used):
 
@@ -315,74 +357,265 @@ Return JSON:
 Rules should be specific and actionable (e.g. "Naming 2-3 specific instruments works better than genre labels").
 Return 2-4 rules per category. Return ONLY the JSON."""
 
-    try:
-        global_rules = ask_json(phase_a_prompt)
-        rules["global_rules"] = {
-            "positive": global_rules.get("positive", [])[:4],
-            "negative": global_rules.get("negative", [])[:4],
-        }
-    except Exception:
-        pass  # Keep existing rules if Gemini fails
 
-    # --- Phase B: Per-emotion analysis ---
-    emotions_seen = set()
-    for e in entries:
-        emo = e.get("final_profile", {}).get("emotion", "").lower()
-        if emo:
-            emotions_seen.add(emo)
-
-    for emotion in emotions_seen:
-        emo_entries = [
-            e for e in entries
-            if e.get("final_profile", {}).get("emotion", "").lower() == emotion
-        ]
-        if len(emo_entries) < 2:
-            continue
+_RANGES_SCHEMA = """"preferred_params": {
+    "energy_range": [<low>, <high>],
+    "style_range": [<low>, <high>],
+    "warmth_range": [<low>, <high>],
+    "arc_range": [<low>, <high>]
+  }"""
+
+
+def _phase_b_schema(emotion):
+    fields = [
+        f'"prompt_principles": ["<what works for {emotion}>"]',
+        f'"anti_patterns": ["<what to avoid for {emotion}>"]',
+        '"best_prompt_template": "<a template like: A slow {instrument} melody in a minor key...>"',
+    ]
+    # Ranges are only asked for when they aren't estimated locally (LEARNED_RANGES=llm)
+    if LEARNED_RANGES == "llm":
+        fields.insert(0, _RANGES_SCHEMA)
+    return "{\n" + ",\n".join(f"  {field}" for field in fields) + "\n}"
+
+
+def _phase_b_prompt(emotion, emo_entries, slider_summary):
+    sections = [
+        f'Analyze feedback for the emotion "{emotion}" in AI music generation.',
+        f"Entries:\n{_format_entries_for_reflection(emo_entries)}",
+    ]
+    if LEARNED_RANGES == "llm":
+        sections.append(f"Slider ranges:\n{slider_summary}")
+    sections.append(f"Return JSON for this emotion:\n{_phase_b_schema(emotion)}")
+    if LEARNED_RANGES == "llm":
+        sections.append("Base ranges on the actual slider values from high-rated sessions.")
+    sections.append("Return 1-3 items per list. Return ONLY the JSON.")
+    return "\n\n".join(sections)
 
-        emo_formatted = _format_entries_for_reflection(emo_entries)
-        emo_high = [e for e in emo_entries if e.get("rating", 0) >= 4]
-        emo_ratings = [e.get("rating", 0) for e in emo_entries]
 
-        phase_b_prompt = f"""Analyze feedback for the emotion "{emotion}" in AI music generation.
+def _format_profile_digest(emotion, profile):
+    """One line summarizing what is already known about an emotion."""
+    pref = profile.get("preferred_params", {})
+    ranges = ", ".join(
+        f"{key} {pref[f'{key}_range'][0]}-{pref[f'{key}_range'][1]}"
+        for key in ["energy", "style", "warmth", "arc"] if f"{key}_range" in pref
+    )
+    return (f"{emotion} ({profile.get('sample_count', 0)} sessions, avg rating {profile.get('avg_rating', '?')}): "
+            f"{ranges or 'no ranges yet'}")
 
-Entries:
-{emo_formatted}
 
-Slider ranges:
-{slider_summary}
+def _phase_a_update_prompt(new_entries, rules):
+    formatted = _format_entries_for_reflection(new_entries)
+    current = rules.get("global_rules", {})
+    digest = "\n".join(
+        _format_profile_digest(emotion, get_emotion_profile(emotion) or profile)
+        for emotion, profile in rules.get("emotion_profiles", {}).items()
+    )
+
+    return f"""You are a music AI trainer maintaining rules learned from user feedback on AI-generated music.
+
+Rules learned so far from {rules.get("entries_analyzed", 0)} earlier sessions:
+Positive: {json.dumps(current.get("positive", []))}
+Negative: {json.dumps(current.get("negative", []))}
+
+What is known per emotion:
+{digest or "nothing yet"}
+
+NEW feedback entries since then (rating 1-5, with the prompt used):
+
+{formatted}
+
+Update the rules with this new evidence: keep rules it supports, revise or drop rules it
+contradicts, and add rules for new patterns.
 
-Return JSON for this emotion:
+Return JSON:
 {{
-  "preferred_params": {{
-    "energy_range": [<low>, <high>],
-    "style_range": [<low>, <high>],
-    "warmth_range": [<low>, <high>],
-    "arc_range": [<low>, <high>]
-  }},
-  "prompt_principles": ["<what works for {emotion}>"],
-  "anti_patterns": ["<what to avoid for {emotion}>"],
-  "best_prompt_template": "<a template like: A slow {{instrument}} melody in a minor key...>"
+  "positive": ["<rule 1>", "<rule 2>", "<rule 3>"],
+  "negative": ["<avoid pattern 1>", "<avoid pattern 2>", "<avoid pattern 3>"]
 }}
 
-Base ranges on the actual slider values from high-rated sessions.
-Return 1-3 items per list. Return ONLY the JSON."""
+Rules should be specific and actionable (e.g. "Naming 2-3 specific instruments works better than genre labels").
+Return 2-4 rules per category. Return ONLY the JSON."""
+
+
+def _phase_b_update_prompt(emotion, new_entries, profile):
+    fields = ["prompt_principles", "anti_patterns", "best_prompt_template"]
+    if LEARNED_RANGES == "llm":
+        fields.insert(0, "preferred_params")
+    known = {k: profile[k] for k in fields if k in profile}
+
+    sections = [
+        f'Update what has been learned about the emotion "{emotion}" in AI music generation.',
+        f"Current knowledge, from {profile.get('sample_count', 0)} earlier sessions "
+        f"(avg rating {profile.get('avg_rating', '?')}):\n{json.dumps(known, indent=2)}",
+        f"NEW entries since then:\n{_format_entries_for_reflection(new_entries)}",
+    ]
+    if LEARNED_RANGES == "llm":
+        sections.append(f"New slider ranges:\n{_format_slider_ranges(new_entries)}")
+        sections.append("Shift the ranges only as far as the new high-rated sessions justify; "
+                        "the earlier sessions still count.")
+    sections.append(f"Return the updated JSON for this emotion:\n{_phase_b_schema(emotion)}")
+    sections.append("Return 1-3 items per list. Return ONLY the JSON.")
+    return "\n\n".join(sections)
+
 
+async def _ask_all(prompts):
+    """Send every prompt concurrently (at most REFLECTION_CONCURRENCY at once).
+
+    Returns {name: (reply or exception, seconds)}; one failed call never affects the others.
+    """
+    limiter = asyncio.Semaphore(REFLECTION_CONCURRENCY)
+
+    async def timed(prompt):
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                reply = await ask_json_async(prompt)
+            except Exception as e:
+                reply = e
+            return reply, time.perf_counter() - started
+
+    replies = await asyncio.gather(*(timed(p) for p in prompts.values()))
+    return dict(zip(prompts, replies))
+
+
+def run_reflection(full=False):
+    """Core batch learning: analyze feedback to extract reusable rules.
+
+    Phase A: Global rules from high vs. low-rated prompts
+    Phase B: Per-emotion analysis
+    Phase C: Parameter correlation
+
+    After the first cycle, reflection is incremental: Gemini sees only entries
+    added since the last cycle plus a digest of what was already learned, and
+    updates the existing rules and profiles. full=True rebuilds from every entry.
+    The global rules and each emotion profile keep their own entries_analyzed
+    mark, advanced only when that call succeeds, so entries a failed call missed
+    are sent again next cycle. The Phase A call and every Phase B call are in
+    flight together, so wall time follows the slowest call rather than the sum.
+    """
+    entries = _load_feedback()
+    if len(entries) < REFLECTION_THRESHOLD:
+        return
+
+    started = time.perf_counter()
+    rules = _load_learned_rules_for_update()
+    analyzed = rules.get("entries_analyzed", 0)
+    if REFLECTION_FULL_EVERY and (rules.get("reflection_count", 0) + 1) % REFLECTION_FULL_EVERY == 0:
+        full = True
+    if rules.get("vocab") != VOCAB_VERSION:
+        full = True  # Profiles are keyed by canonical emotion; regroup everything under the current vocabulary
+    # The log is append-only, so everything past entries_analyzed is new
+    incremental = not full and rules.get("reflection_count", 0) > 0 and 0 < analyzed <= len(entries)
+    new_entries = entries[analyzed:] if incremental else entries
+    profiles = rules.setdefault("emotion_profiles", {})
+
+    # A profile's own mark trails the global one when its last Phase B call failed
+    floor = analyzed if incremental else 0
+    marks = {emotion: p.get("entries_analyzed", floor) for emotion, p in profiles.items()} if incremental else {}
+    by_emotion = {}
+    for position in range(min([floor, *marks.values()]), len(entries)):
+        e = entries[position]
+        emo = canonical_emotion(e.get("final_profile", {}).get("emotion", ""))
+        if emo and position >= marks.get(emo, floor):
+            by_emotion.setdefault(emo, []).append(e)
+    if not new_entries and not by_emotion:
+        return
+
+    prompts = {}
+    updates = {}  # emotion -> entries the Phase B reply accounts for, and whether it extends a profile
+    if incremental:
+        if new_entries:
+            prompts["phase_a"] = _phase_a_update_prompt(new_entries, rules)
+        slider_summary = None  # Built per emotion below
+    else:
+        prompts["phase_a"] = _phase_a_prompt(entries)
+        slider_summary = _format_slider_ranges() if LEARNED_RANGES == "llm" else None
+    for emotion, emo_entries in by_emotion.items():
+        if incremental and emotion in profiles:
+            prompts[emotion] = _phase_b_update_prompt(emotion, emo_entries, profiles[emotion])
+            updates[emotion] = (emo_entries, True)
+            continue
+        summary = slider_summary
+        if incremental:
+            # First profile for this emotion: older entries that were never profiled count too
+            emo_entries = find_entries(emotion, range(1, MAX_RATING + 1))
+            summary = _format_slider_ranges(emo_entries) if LEARNED_RANGES == "llm" else None
+        if len(emo_entries) >= 2:
+            prompts[emotion] = _phase_b_prompt(emotion, emo_entries, summary)
+            updates[emotion] = (emo_entries, False)
+    replies = run_async(_ask_all(prompts))
+
+    # --- Phase A: Global rules ---
+    global_rules, phase_a_s = replies.pop("phase_a", ({}, 0.0))  # Absent: only lagging profiles to catch up
+    phase_a_failed = False
+    try:
+        if isinstance(global_rules, Exception):
+            raise global_rules
+        if "phase_a" in prompts:
+            rules["global_rules"] = {
+                "positive": global_rules.get("positive", [])[:4],
+                "negative": global_rules.get("negative", [])[:4],
+            }
+    except Exception:
+        phase_a_failed = True  # Keep existing rules and their mark if Gemini fails
+
+    # --- Phase B: Per-emotion analysis ---
+    phase_b_failed = 0
+    for emotion, (emo_profile, _) in replies.items():
         try:
-            emo_profile = ask_json(phase_b_prompt)
-            emo_profile["sample_count"] = len(emo_entries)
-            emo_profile["avg_rating"] = round(sum(emo_ratings) / len(emo_ratings), 1)
-            rules.setdefault("emotion_profiles", {})[emotion] = emo_profile
+            if isinstance(emo_profile, Exception):
+                raise emo_profile
+            emo_entries, extends = updates[emotion]
+            count = len(emo_entries)
+            total = sum(e.get("rating", 0) for e in emo_entries)
+            if extends:
+                # Fold the new ratings into the running count and average
+                old = profiles[emotion]
+                old_count = old.get("sample_count", 0)
+                total += old.get("avg_rating", 0) * old_count
+                count += old_count
+            emo_profile["sample_count"] = count
+            emo_profile["avg_rating"] = round(total / count, 1)
+            emo_profile["entries_analyzed"] = len(entries)
+            profiles[emotion] = emo_profile
         except Exception:
-            pass
+            phase_b_failed += 1
+            if emotion in profiles:
+                # Pin the mark it had, so its new entries are sent again next cycle
+                profiles[emotion].setdefault("entries_analyzed", analyzed)
+    for emotion, profile in profiles.items():
+        if emotion not in by_emotion:
+            profile["entries_analyzed"] = len(entries)  # Nothing new for it this cycle
+    if not incremental:
+        # Profiles under a synonym ("melancholy") are superseded once their canonical bucket is rebuilt
+        for key in list(profiles):
+            if canonical_emotion(key) != key and canonical_emotion(key) in profiles:
+                del profiles[key]
 
     # --- Phase C: Parameter correlation ---
-    param_insights = _compute_param_insights(entries)
+    phase_c_started = time.perf_counter()
+    param_insights = get_param_insights()
     if param_insights:
         rules["param_insights"] = param_insights
 
     # Update metadata
     rules["last_reflection"] = datetime.now().isoformat()
     rules["reflection_count"] = rules.get("reflection_count", 0) + 1
-    rules["entries_analyzed"] = len(entries)
+    if not phase_a_failed:
+        rules["entries_analyzed"] = len(entries)
+    rules["vocab"] = VOCAB_VERSION
+    phase_b_times = [seconds for _, seconds in replies.values()]
+    rules["reflection_metrics"] = {
+        "mode": "incremental" if incremental else "full",
+        "entries_sent": len(new_entries),
+        "phase_a_s": round(phase_a_s, 2),
+        "phase_a_failed": phase_a_failed,
+        "phase_b_calls": len(replies),
+        "phase_b_failed": phase_b_failed,
+        "phase_b_slowest_s": round(max(phase_b_times, default=0.0), 2),
+        "phase_b_total_s": round(sum(phase_b_times), 2),
+        "phase_c_s": round(time.perf_counter() - phase_c_started, 3),
+        "wall_s": round(time.perf_counter() - started, 2),
+    }
 
     _save_learned_rules(rules)
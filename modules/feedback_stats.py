@@ -0,0 +1,295 @@
+import json
+import math
+import os
+import threading
+import numpy as np
+from modules.feedback_store import entries_since
+from modules.emotion_vocab import canonical_emotion, EMOTION_LEXICON, VOCAB_VERSION
+
+STATS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "feedback_stats.json")
+
+DIMENSIONS = ["energy", "style", "warmth", "arc"]
+GEN_PARAM_DEFAULTS = {"temperature": 1.0, "guidance_scale": 3.0, "max_new_tokens": 256}
+PARAM_HISTORY_SIZE = 10
+
+# Learned slider ranges: weighted quantiles of well-rated sessions, shrunk toward the
+# emotion's own lexicon position until it has RANGE_PRIOR_STRENGTH sessions' worth of weight
+RANGE_RATING_WEIGHTS = {5: 1.0, 4: 0.6, 3: 0.15}
+RANGE_QUANTILES = (0.2, 0.8)
+RANGE_PRIOR_STRENGTH = float(os.getenv("RANGE_PRIOR_STRENGTH", "5"))
+RANGE_MIN_SESSIONS = 2  # Sessions rated 4+ before an emotion gets a learned range at all
+RANGE_PRIOR_HALF_WIDTH = 15  # Prior range is the lexicon value +/- this
+RANGE_NEUTRAL_PRIOR = (20, 80)  # Prior for emotions outside the lexicon
+
+_lock = threading.Lock()
+_stats = None
+_ranges = None  # (entries covered, {emotion: ranges})
+
+
+def _empty_stats():
+    return {
+        "entries": 0,  # Log entries folded in so far
+        "vocab": VOCAB_VERSION,  # Emotion buckets follow this vocabulary version
+        # canonical emotion -> rating -> {"sessions": n, dim: running moments + sparse histogram}
+        "emotions": {},
+        # gen param -> running sums against rating, for Pearson correlation
+        "params": {p: {"n": 0, "sx": 0.0, "sy": 0.0, "sxx": 0.0, "syy": 0.0, "sxy": 0.0} for p in GEN_PARAM_DEFAULTS},
+        # rating -> gen param -> [count, sum]
+        "params_by_rating": {},
+        "param_history": [],
+    }
+
+
+def _new_moments():
+    return {"n": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None, "hist": {}}
+
+
+def _add_value(moments, value):
+    moments["n"] += 1
+    moments["sum"] += value
+    moments["sumsq"] += value * value
+    moments["min"] = value if moments["min"] is None else min(moments["min"], value)
+    moments["max"] = value if moments["max"] is None else max(moments["max"], value)
+    # Slider values are 0-100 integers, so an integer histogram gives exact percentiles
+    bucket = str(int(round(value)))
+    moments["hist"][bucket] = moments["hist"].get(bucket, 0) + 1
+
+
+def _fold(stats, entry):
+    fp = entry.get("final_profile", {})
+    emotion = canonical_emotion(fp.get("emotion", "unknown"))
+    rating = entry.get("rating", 0)
+    cell = stats["emotions"].setdefault(emotion, {}).setdefault(str(rating), {"sessions": 0})
+    cell["sessions"] += 1
+    for dim in DIMENSIONS:
+        if isinstance(fp.get(dim), (int, float)):
+            _add_value(cell.setdefault(dim, _new_moments()), fp[dim])
+
+    gen_params = entry.get("gen_params")
+    if gen_params:
+        by_rating = stats["params_by_rating"].setdefault(str(rating), {})
+        for param, default in GEN_PARAM_DEFAULTS.items():
+            x = gen_params.get(param, default)
+            count_sum = by_rating.setdefault(param, [0, 0.0])
+            count_sum[0] += 1
+            count_sum[1] += x
+            acc = stats["params"][param]
+            acc["n"] += 1
+            acc["sx"] += x
+            acc["sy"] += rating
+            acc["sxx"] += x * x
+            acc["syy"] += rating * rating
+            acc["sxy"] += x * rating
+        stats["param_history"] = (stats["param_history"] + [{"rating": rating, "params": gen_params}])[-PARAM_HISTORY_SIZE:]
+
+    stats["entries"] += 1
+
+
+def _load():
+    path = os.path.abspath(STATS_PATH)
+    try:
+        with open(path, "r") as f:
+            stats = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _empty_stats()
+    if stats.get("vocab") != VOCAB_VERSION:
+        return _empty_stats()  # Bucketed under another vocabulary: rebuild from the log
+    return stats
+
+
+def _sync():
+    """Fold in log entries this aggregate hasn't seen yet. Caller holds _lock."""
+    global _stats
+    if _stats is None:
+        _stats = _load()
+    new = entries_since(_stats["entries"])
+    if new is None:  # Log is shorter than what we aggregated: it was replaced, so rebuild
+        _stats = _empty_stats()
+        new = entries_since(0)
+    for entry in new:
+        _fold(_stats, entry)
+    return bool(new)
+
+
+def update():
+    """Bring the aggregate up to date with the feedback log and persist it."""
+    with _lock:
+        if not _sync():
+            return
+        path = os.path.abspath(STATS_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            json.dump(_stats, f)
+        os.replace(tmp, path)
+
+
+def _quantile(hist, n, q):
+    target = q * (n - 1)
+    seen = 0
+    for value in sorted(hist, key=int):
+        seen += hist[value]
+        if seen > target:
+            return int(value)
+    return None
+
+
+def _summarize(moments, percentiles):
+    n = moments["n"]
+    mean = moments["sum"] / n
+    variance = max(moments["sumsq"] / n - mean * mean, 0.0)
+    summary = {"n": n, "mean": mean, "std": math.sqrt(variance), "min": moments["min"], "max": moments["max"]}
+    if percentiles:
+        for q in (10, 50, 90):
+            summary[f"p{q}"] = _quantile(moments["hist"], n, q / 100)
+    return summary
+
+
+def _merge_cells(cells, with_hist):
+    """Combine per-rating cells into one (sessions, {dim: moments})."""
+    sessions = 0
+    merged = {}
+    for cell in cells:
+        sessions += cell["sessions"]
+        for dim in DIMENSIONS:
+            if dim not in cell:
+                continue
+            m = merged.setdefault(dim, _new_moments())
+            src = cell[dim]
+            m["n"] += src["n"]
+            m["sum"] += src["sum"]
+            m["sumsq"] += src["sumsq"]
+            m["min"] = src["min"] if m["min"] is None else min(m["min"], src["min"])
+            m["max"] = src["max"] if m["max"] is None else max(m["max"], src["max"])
+            if with_hist:
+                for value, count in src["hist"].items():
+                    m["hist"][value] = m["hist"].get(value, 0) + count
+    return sessions, merged
+
+
+def get_emotion_stats(emotion, min_rating=None, max_rating=None, percentiles=True):
+    """Slider statistics for one emotion over a rating range.
+
+    Returns {"sessions", "avg_rating", dim: {n, mean, std, min, max[, p10, p50, p90]}}
+    or None if no session matches. Cost depends on the number of rating buckets
+    (and histogram bins, for percentiles), not on the number of entries.
+    """
+    with _lock:
+        _sync()
+        by_rating = _stats["emotions"].get(canonical_emotion(emotion), {})
+        ratings = [
+            r for r in by_rating
+            if (min_rating is None or float(r) >= min_rating) and (max_rating is None or float(r) <= max_rating)
+        ]
+        sessions, merged = _merge_cells((by_rating[r] for r in ratings), percentiles)
+        rating_sum = sum(float(r) * by_rating[r]["sessions"] for r in ratings)
+    if not sessions:
+        return None
+    result = {"sessions": sessions, "avg_rating": round(rating_sum / sessions, 1)}
+    result.update({dim: _summarize(m, percentiles) for dim, m in merged.items() if m["n"]})
+    return result
+
+
+def get_emotions():
+    """Every emotion that has at least one session."""
+    with _lock:
+        _sync()
+        return list(_stats["emotions"])
+
+
+def get_param_insights(high_rating=4):
+    """Best gen params (average over high-rated sessions), rating correlations and recent history."""
+    with _lock:
+        _sync()
+        if not any(acc["n"] for acc in _stats["params"].values()):
+            return None
+        high = [cell for r, cell in _stats["params_by_rating"].items() if float(r) >= high_rating]
+        insights = {}
+        for param, default in GEN_PARAM_DEFAULTS.items():
+            count = sum(cell[param][0] for cell in high if param in cell)
+            total = sum(cell[param][1] for cell in high if param in cell)
+            insights[param] = round(total / count, 2) if count else default
+        correlations = {param: _pearson(acc) for param, acc in _stats["params"].items()}
+        history = list(_stats["param_history"])
+
+    return {
+        "best_temperature": insights["temperature"],
+        "best_guidance_scale": insights["guidance_scale"],
+        "best_max_new_tokens": round(insights["max_new_tokens"]),
+        "rating_correlations": correlations,
+        "param_history": history,
+    }
+
+
+def _pearson(acc):
+    n = acc["n"]
+    if n < 2:
+        return None
+    cov = acc["sxy"] - acc["sx"] * acc["sy"] / n
+    var_x = acc["sxx"] - acc["sx"] ** 2 / n
+    var_y = acc["syy"] - acc["sy"] ** 2 / n
+    if var_x <= 1e-12 or var_y <= 1e-12:
+        return None  # Constant param or rating: correlation undefined
+    return round(cov / math.sqrt(var_x * var_y), 3)
+
+
+def get_learned_ranges():
+    """Preferred slider ranges for every emotion with enough well-rated sessions.
+
+    Returns {emotion: {"energy_range": [lo, hi], ..., "weight": effective sessions}}.
+    All emotions are estimated in one vectorized pass over the histograms and the
+    result is reused until a new rating arrives.
+    """
+    global _ranges
+    with _lock:
+        _sync()
+        if _ranges is not None and _ranges[0] == _stats["entries"]:
+            return _ranges[1]
+        emotions = [
+            emotion for emotion, by_rating in _stats["emotions"].items()
+            if sum(cell["sessions"] for r, cell in by_rating.items() if float(r) >= 4) >= RANGE_MIN_SESSIONS
+        ]
+        # weighted[e, d, v]: rating-weighted count of sessions where dimension d had value v
+        weighted = np.zeros((len(emotions), len(DIMENSIONS), 101))
+        for i, emotion in enumerate(emotions):
+            for rating, cell in _stats["emotions"][emotion].items():
+                weight = RANGE_RATING_WEIGHTS.get(round(float(rating)), 0.0)
+                if not weight:
+                    continue
+                for d, dim in enumerate(DIMENSIONS):
+                    for value, count in cell.get(dim, {}).get("hist", {}).items():
+                        weighted[i, d, min(max(int(value), 0), 100)] += weight * count
+        covered = _stats["entries"]
+
+    ranges = {}
+    if emotions:
+        per_emotion = _weighted_quantiles(weighted)  # (E, D, 2)
+        prior = np.array([_prior_range(emotion) for emotion in emotions])  # (E, D, 2)
+        mass = weighted.sum(axis=2)  # (E, D) effective sessions per dimension
+        shrink = (mass / (mass + RANGE_PRIOR_STRENGTH))[..., None]
+        blended = np.rint(shrink * per_emotion + (1 - shrink) * prior).astype(int)
+        for i, emotion in enumerate(emotions):
+            ranges[emotion] = {f"{dim}_range": blended[i, d].tolist() for d, dim in enumerate(DIMENSIONS)}
+            ranges[emotion]["weight"] = round(float(mass[i].max()), 2)
+
+    with _lock:
+        _ranges = (covered, ranges)
+    return ranges
+
+
+def _prior_range(emotion):
+    """[lo, hi] per dimension for an emotion with no evidence: around its lexicon position, else wide."""
+    center = EMOTION_LEXICON.get(emotion)
+    if center is None:
+        return [list(RANGE_NEUTRAL_PRIOR)] * len(DIMENSIONS)
+    return [[max(v - RANGE_PRIOR_HALF_WIDTH, 0), min(v + RANGE_PRIOR_HALF_WIDTH, 100)] for v in center]
+
+
+def _weighted_quantiles(weighted):
+    """RANGE_QUANTILES of value histograms along the last axis; empty rows give 0."""
+    cdf = np.cumsum(weighted, axis=-1)
+    total = cdf[..., -1:]
+    cdf = np.divide(cdf, total, out=np.zeros_like(cdf), where=total > 0)
+    q = np.array(RANGE_QUANTILES)
+    # First value whose cumulative weight reaches each quantile
+    return (cdf[..., None, :] >= q[:, None] - 1e-9).argmax(axis=-1)
@@ -0,0 +1,214 @@
+import bisect
+import json
+import os
+import threading
+from modules.emotion_vocab import canonical_emotion
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still atomic, but only serialized within this process
+    fcntl = None
+
+FEEDBACK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "feedback.jsonl")
+LEGACY_FEEDBACK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "feedback.json")
+
+_lock = threading.Lock()
+_entries = []
+_offset = 0  # Bytes of the log already parsed into _entries
+_file_id = None  # (device, inode) of the log we parsed, to notice it being replaced
+# canonical emotion -> rating -> [(timestamp, seq, entry)] sorted by time, kept in step with _entries
+_index = {}
+_migration_checked = False  # Legacy feedback.json was migrated, absent or unreadable; don't look again
+_migration_lock = threading.Lock()
+
+
+class _FileLock:
+    """Exclusive flock on an open file, held for the duration of the with block."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self.f
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+
+
+def _migrate_legacy(path):
+    """Convert the old whole-file feedback.json into the log, once.
+
+    Attempted once per process: an unreadable legacy file is reported and left
+    in place instead of failing every later store call. Other threads wait until
+    the attempt has finished, so none of them reads or appends to a log that is
+    still being converted.
+    """
+    global _migration_checked
+    if _migration_checked:
+        return
+    with _migration_lock:
+        if _migration_checked:
+            return
+        try:
+            _migrate_legacy_once(path)
+        finally:
+            _migration_checked = True
+
+
+def _migrate_legacy_once(path):
+    legacy = os.path.abspath(LEGACY_FEEDBACK_PATH)
+    if os.path.exists(path) or not os.path.exists(legacy):
+        return
+    try:
+        with open(legacy, "r") as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("expected a JSON list of entries")
+    except FileNotFoundError:
+        return  # Another process just migrated it
+    except ValueError as e:
+        print(f"Could not migrate {legacy} ({e}); starting a new feedback log and leaving it untouched")
+        return
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp, path)  # Fails if another process migrated first
+        os.rename(legacy, legacy + ".migrated")
+        print(f"Migrated {len(entries)} feedback entries to {path}")
+    except FileExistsError:
+        if os.path.exists(legacy):
+            print(f"{path} already exists; leaving {legacy} unmerged")
+    finally:
+        os.remove(tmp)
+
+
+def append_entry(entry):
+    """Durably append one entry; safe across threads and processes."""
+    path = os.path.abspath(FEEDBACK_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _migrate_legacy(path)
+    line = (json.dumps(entry) + "\n").encode("utf-8")
+
+    with _lock, open(path, "ab") as f, _FileLock(f):
+        # A crash mid-append leaves an unterminated line; end it so this entry starts clean
+        if f.tell() and _last_byte(path) != b"\n":
+            line = b"\n" + line
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _last_byte(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1)
+
+
+def _emotion_of(entry):
+    return canonical_emotion(entry.get("final_profile", {}).get("emotion", ""))
+
+
+def _add(entry):
+    _entries.append(entry)
+    ratings = _index.setdefault(_emotion_of(entry), {})
+    bucket = ratings.setdefault(entry.get("rating"), [])
+    # Appends arrive in time order, so this is almost always an append at the end
+    bisect.insort(bucket, (entry.get("timestamp", ""), len(_entries), entry))
+
+
+def _refresh():
+    """Parse whatever was appended to the log since the last call. Caller holds _lock."""
+    global _offset, _file_id
+    path = os.path.abspath(FEEDBACK_PATH)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+    if stat is None or (stat.st_dev, stat.st_ino) != _file_id or stat.st_size < _offset:
+        _entries.clear()  # Log was replaced, truncated or removed: start over
+        _index.clear()
+        _offset, _file_id = 0, (stat.st_dev, stat.st_ino) if stat else None
+    if stat is None or stat.st_size == _offset:
+        return
+
+    with open(path, "rb") as f:
+        f.seek(_offset)
+        chunk = f.read(stat.st_size - _offset)
+    complete = chunk.rfind(b"\n") + 1  # Leave a half-written last line for the next read
+    for raw in chunk[:complete].splitlines():
+        if not raw.strip():
+            continue
+        try:
+            _add(json.loads(raw))
+        except json.JSONDecodeError:
+            print(f"Skipping corrupt feedback line: {raw[:80]!r}")
+    _offset += complete
+
+
+def load_entries():
+    """Return every feedback entry, oldest first.
+
+    Entries are parsed once; later calls only read what was appended since
+    (by this or any other process). The list is new, but the entry dicts are
+    the ones the index holds, as with every function here: treat them as read-only.
+    """
+    _migrate_legacy(os.path.abspath(FEEDBACK_PATH))
+    with _lock:
+        _refresh()
+        return list(_entries)
+
+
+def entries_since(n):
+    """Entries after the first n, or None if the log now holds fewer than n. Read-only, as load_entries."""
+    _migrate_legacy(os.path.abspath(FEEDBACK_PATH))
+    with _lock:
+        _refresh()
+        if n > len(_entries):
+            return None
+        return _entries[n:]
+
+
+def entries_at(positions):
+    """Entries at the given log positions (0 = oldest), in the order asked for. Read-only, as load_entries."""
+    _migrate_legacy(os.path.abspath(FEEDBACK_PATH))
+    with _lock:
+        _refresh()
+        return [_entries[i] for i in positions if i < len(_entries)]
+
+
+def count_entries():
+    """Number of feedback entries, without copying them."""
+    _migrate_legacy(os.path.abspath(FEEDBACK_PATH))
+    with _lock:
+        _refresh()
+        return len(_entries)
+
+
+def find_entries(emotion, ratings, newest_first=False, where=None, limit=None):
+    """Entries for one emotion and its synonyms, bucket by bucket in the given rating order.
+
+    Within a rating, entries come oldest first (or newest first). Only the
+    matching buckets are visited, so cost is independent of total history.
+    Entries are read-only, as with load_entries.
+    """
+    _migrate_legacy(os.path.abspath(FEEDBACK_PATH))
+    found = []
+    with _lock:
+        _refresh()
+        by_rating = _index.get(canonical_emotion(emotion), {})
+        for rating in ratings:
+            bucket = by_rating.get(rating, ())
+            for _, _, entry in (reversed(bucket) if newest_first else bucket):
+                if where is None or where(entry):
+                    found.append(entry)
+                    if limit is not None and len(found) >= limit:
+                        return found
+    return found
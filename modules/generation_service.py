@@ -0,0 +1,216 @@
+"""Shared MusicGen worker process.
+
+One process owns the model; every Streamlit session sends its request here over
+a local socket. Requests that arrive within MUSICGEN_BATCH_WINDOW_MS of each other
+(and share generation settings) are padded into a single forward pass of up to
+MUSICGEN_MAX_BATCH prompts.
+
+Run it with:
+    python -m modules.generation_service
+and start the app with MUSICGEN_SERVICE=localhost:6150.
+
+Connections must present MUSICGEN_SERVICE_KEY. If it is not set, the service
+generates a random key into data/musicgen_service.key (readable only by its
+owner), where clients on the same machine pick it up. Requests and replies are
+validated JSON; nothing received is unpickled.
+"""
+import base64
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener
+from queue import Queue, Empty
+from modules.music_generator import (
+    SERVICE_ADDR,
+    SERVICE_KEY_PATH,
+    _generate_batch,
+    _variation_prompts,
+    warm_up,
+)
+
+DEFAULT_ADDR = "localhost:6150"
+MAX_BATCH = int(os.getenv("MUSICGEN_MAX_BATCH", "8"))  # prompts per forward pass
+BATCH_WINDOW_MS = int(os.getenv("MUSICGEN_BATCH_WINDOW_MS", "50"))
+MAX_REQUEST_BYTES = 64 * 1024
+
+# Request field -> (type, default, min, max); prompt and seed are checked separately
+_PARAM_LIMITS = {
+    "num_variations": (int, 2, 1, 2),
+    "max_new_tokens": (int, 128, 1, 2048),
+    "temperature": (float, 1.0, 0.01, 5.0),
+    "guidance_scale": (float, 3.0, 0.0, 20.0),
+}
+
+_jobs = Queue()
+
+
+def _collect_batch(carry):
+    """Wait for one job, then gather compatible jobs until the batch is full or the window closes.
+
+    Jobs with different settings (or that would overflow the batch) are carried
+    over to the next round, ahead of anything newer.
+    """
+    first = carry.popleft() if carry else _jobs.get()
+    batch = [first]
+    size = len(first["prompts"])
+    skipped = []
+
+    while carry and size < MAX_BATCH:
+        job = carry.popleft()
+        if job["key"] == first["key"] and size + len(job["prompts"]) <= MAX_BATCH:
+            batch.append(job)
+            size += len(job["prompts"])
+        else:
+            skipped.append(job)
+
+    deadline = time.monotonic() + BATCH_WINDOW_MS / 1000
+    while size < MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            job = _jobs.get(timeout=remaining)
+        except Empty:
+            break
+        if job["key"] == first["key"] and size + len(job["prompts"]) <= MAX_BATCH:
+            batch.append(job)
+            size += len(job["prompts"])
+        else:
+            skipped.append(job)
+
+    carry.extendleft(reversed(skipped))
+    return batch
+
+
+def _run_batch(batch):
+    """Generate every prompt in the batch at once and hand each job its slice of the audio."""
+    prompts = [p for job in batch for p in job["prompts"]]
+    started = time.monotonic()
+    try:
+        audio, _ = _generate_batch(prompts, **batch[0]["params"])  # This loop is the only sampler
+    except Exception as exc:
+        for job in batch:
+            job["reply"] = {"error": str(exc)}
+    else:
+        offset = 0
+        for job in batch:
+            count = len(job["prompts"])
+            job["reply"] = {"audio": audio[offset:offset + count]}
+            offset += count
+    print(f"Batch of {len(batch)} request(s) / {len(prompts)} prompt(s) in {time.monotonic() - started:.1f}s")
+    for job in batch:
+        job["done"].set()
+
+
+def _batch_loop():
+    carry = deque()
+    while True:
+        _run_batch(_collect_batch(carry))
+
+
+def _parse_request(raw):
+    """Decode and validate one JSON request. Returns (prompt, num_variations, params); raises ValueError."""
+    request = json.loads(raw)
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+    prompt = request.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip() or len(prompt) > 2000:
+        raise ValueError("'prompt' must be a non-empty string of at most 2000 characters")
+
+    values = {}
+    for name, (kind, default, low, high) in _PARAM_LIMITS.items():
+        value = request.get(name, default)
+        # bool is an int subclass; floats may arrive as JSON integers
+        if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else int):
+            raise ValueError(f"'{name}' must be {'a number' if kind is float else 'an integer'}")
+        if not low <= value <= high:
+            raise ValueError(f"'{name}' must be between {low} and {high}")
+        values[name] = kind(value)
+
+    seed = request.get("seed")
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed < 2 ** 63):
+        raise ValueError("'seed' must be null or a non-negative integer")
+
+    num_variations = values.pop("num_variations")
+    return prompt, num_variations, dict(values, seed=seed)
+
+
+def _reply(conn, reply):
+    try:
+        conn.send_bytes(json.dumps(reply).encode())
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # Client gave up (e.g. Streamlit rerun) — nothing to deliver
+
+
+def _handle_connection(conn):
+    """Serve one request: queue it, wait for its batch to finish, send the WAV bytes back."""
+    with conn:
+        try:
+            prompt, num_variations, params = _parse_request(conn.recv_bytes(MAX_REQUEST_BYTES))
+        except EOFError:
+            return
+        except (OSError, ValueError) as exc:  # oversized, not JSON, or out-of-range fields
+            _reply(conn, {"error": f"Bad request: {exc}"})
+            return
+        job = {
+            "prompts": _variation_prompts(prompt, num_variations),
+            "params": params,
+            "key": tuple(sorted(params.items())),
+            "done": threading.Event(),
+        }
+        if params["seed"] is not None:
+            # A seeded result must not depend on what else shares the batch
+            job["key"] += (id(job),)
+        _jobs.put(job)
+        job["done"].wait()
+        reply = job["reply"]
+        if "audio" in reply:
+            reply = {"audio": [base64.b64encode(audio).decode("ascii") for audio in reply["audio"]]}
+        _reply(conn, reply)
+
+
+def _load_or_create_key():
+    """MUSICGEN_SERVICE_KEY, else the key file (created with a random key, mode 0600, on first start)."""
+    key = os.getenv("MUSICGEN_SERVICE_KEY")
+    if key:
+        return key.encode()
+    path = os.path.abspath(SERVICE_KEY_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        if os.stat(path).st_mode & 0o077:
+            raise RuntimeError(f"{path} is readable by other users; remove it or chmod 600 it") from None
+        with open(path, "rb") as f:
+            return f.read().strip()
+    key = secrets.token_hex(32).encode()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    print(f"Generated a service key in {path}")
+    return key
+
+
+def serve(addr=None):
+    """Load the model once and serve generation requests until interrupted."""
+    host, _, port = (addr or SERVICE_ADDR or DEFAULT_ADDR).rpartition(":")
+    key = _load_or_create_key()
+    warm_up()
+    threading.Thread(target=_batch_loop, daemon=True).start()
+
+    with Listener((host or "localhost", int(port)), authkey=key) as listener:
+        print(f"MusicGen service listening on {host or 'localhost'}:{port} "
+              f"(max batch {MAX_BATCH}, window {BATCH_WINDOW_MS}ms)")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as exc:  # bad authkey, dropped handshake
+                print(f"Rejected connection: {exc}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,9 +1,24 @@
-from utils.llm_client import ask_json_with_image
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from utils.llm_client import ask_json_with_image, ask_json_with_image_async
 
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))  # px; 0 keeps full resolution
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()  # jpeg | webp
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "32"))  # prepared images kept per process
 
-def analyze_image(image_bytes):
-    """Analyze an image for emotional content. Returns mood dict."""
-    prompt = """Analyze this image for its emotional content.
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+
+_PROMPT = """Analyze this image for its emotional content.
 Return ONLY a JSON object with these keys:
 - caption: one sentence describing what you see
 - moods: a list of 1-3 emotion words detected (most dominant first)
@@ -15,6 +30,63 @@ Example: a sunset over ruins →
 
 Return ONLY valid JSON, no other text."""
 
-    result = ask_json_with_image(prompt, image_bytes)
+
+def prepare_image(image_bytes):
+    """Downscale and re-encode an upload for Gemini. Returns (bytes, mime_type).
+
+    The image is rotated upright, shrunk to IMAGE_MAX_SIDE on its longest side and
+    re-encoded without EXIF/ICC metadata. Results are cached by content hash, so
+    Streamlit reruns with the same upload skip the decode.
+    """
+    key = hashlib.sha256(image_bytes).hexdigest()
+    with _prepared_lock:
+        if key in _prepared:
+            _prepared.move_to_end(key)
+            return _prepared[key]
+
+    prepared = _downscale(image_bytes)
+    with _prepared_lock:
+        _prepared[key] = prepared
+        while len(_prepared) > IMAGE_CACHE_SIZE:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def _downscale(image_bytes):
+    if IMAGE_FORMAT not in _FORMATS:
+        raise RuntimeError(f"Unknown IMAGE_FORMAT '{IMAGE_FORMAT}' (choose from {', '.join(_FORMATS)})")
+    pil_format, mime_type = _FORMATS[IMAGE_FORMAT]
+
+    img = Image.open(io.BytesIO(image_bytes))
+    if IMAGE_MAX_SIDE:
+        # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale, so a 12MP photo is never fully decoded
+        img.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    img = ImageOps.exif_transpose(img)  # Apply the orientation tag before it is dropped
+    if IMAGE_MAX_SIDE:
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+
+    if img.mode in ("RGBA", "LA", "P") and pil_format == "JPEG":
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, quality=IMAGE_QUALITY)  # No exif= / icc_profile=, so both are stripped
+    return buf.getvalue(), mime_type
+
+
+def analyze_image(image_bytes):
+    """Analyze an image for emotional content. Returns mood dict."""
+    result = ask_json_with_image(_PROMPT, *prepare_image(image_bytes))
+    result["source"] = "image"
+    return result
+
+
+async def analyze_image_async(image_bytes):
+    """Async analyze_image."""
+    prepared = await asyncio.to_thread(prepare_image, image_bytes)
+    result = await ask_json_with_image_async(_PROMPT, *prepared)
     result["source"] = "image"
     return result
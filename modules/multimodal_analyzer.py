@@ -0,0 +1,135 @@
+import asyncio
+import os
+from utils.llm_client import ask_json_async, ask_json_with_image_async
+from modules.text_analyzer import analyze_text_async
+from modules.image_analyzer import analyze_image_async, prepare_image
+from modules.voice_analyzer import analyze_voice_async, transcribe_audio, SILENT_MOOD
+from modules.emotion_fuser import (
+    PROFILE_SCHEMA, FUSION_RULES, apply_learned_knowledge, fuse_emotions_async, try_local_fusion,
+)
+
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "combined")  # combined | separate
+
+_SOURCE_SCHEMAS = {
+    "text": '{"summary": "<one sentence summary>", "moods": [...], "mood": "...", "energy": <0.0-1.0>}',
+    "image": '{"caption": "<one sentence describing the image>", "moods": [...], "mood": "...", "energy": <0.0-1.0>}',
+    "voice": '{"moods": [...], "mood": "...", "energy": <0.0-1.0>}',
+}
+
+
+def _build_prompt(inputs):
+    """inputs maps each source to how it appears in the prompt."""
+    input_lines = "\n".join(f"- {source}: {desc}" for source, desc in inputs.items())
+    source_schemas = ",\n    ".join(f'"{s}": {_SOURCE_SCHEMAS[s]}' for s in inputs)
+
+    return f"""You are an emotion analyst for a music generation system.
+
+Analyze each of these user inputs for its emotional content:
+{input_lines}
+
+For every input, list 1-3 emotion words (most dominant first) as "moods", the single most
+dominant one as "mood", and "energy" as a float 0.0 to 1.0 (0=very calm, 1=very intense).
+Then blend all inputs into ONE unified emotional profile.
+
+Return ONLY a JSON object of this shape:
+{{
+  "sources": {{
+    {source_schemas}
+  }},
+  "profile": {PROFILE_SCHEMA}
+}}
+
+{FUSION_RULES}
+
+Return ONLY valid JSON, no other text."""
+
+
+def _check_reply(reply, sources):
+    """Raise ValueError unless the reply has a mood per source and a complete profile."""
+    if not isinstance(reply, dict):
+        raise ValueError("combined analysis reply is not a JSON object")
+    per_source = reply.get("sources")
+    profile = reply.get("profile")
+    if not isinstance(per_source, dict) or not isinstance(profile, dict):
+        raise ValueError("combined analysis reply is missing 'sources' or 'profile'")
+    for source in sources:
+        mood = per_source.get(source)
+        if not isinstance(mood, dict) or not mood.get("moods") or not isinstance(mood.get("energy"), (int, float)):
+            raise ValueError(f"combined analysis reply has no usable '{source}' mood")
+    for key in ["emotion", "energy", "style", "warmth", "arc"]:
+        if key not in profile:
+            raise ValueError(f"combined analysis profile is missing '{key}'")
+
+
+async def _analyze_combined(text, image_bytes, voice_bytes):
+    transcript, prepared = await asyncio.gather(
+        asyncio.to_thread(transcribe_audio, voice_bytes) if voice_bytes is not None else asyncio.sleep(0),
+        asyncio.to_thread(prepare_image, image_bytes) if image_bytes is not None else asyncio.sleep(0),
+    )
+    inputs = {}
+    if text:
+        inputs["text"] = f'"{text}"'
+    if prepared is not None:
+        inputs["image"] = "the attached image"
+    if transcript:
+        inputs["voice"] = f'spoken transcript "{transcript}"'
+    if not inputs:
+        # Only a silent recording: nothing to send, fuse the neutral placeholder as before
+        return await _analyze_separate(None, None, voice_bytes)
+
+    prompt = _build_prompt(inputs)
+    if prepared is not None:
+        reply = await ask_json_with_image_async(prompt, *prepared)
+    else:
+        reply = await ask_json_async(prompt)
+    sources = list(inputs)
+    _check_reply(reply, sources)
+
+    mood_list = []
+    for source in sources:
+        mood = dict(reply["sources"][source], source=source)
+        mood.setdefault("mood", mood["moods"][0])
+        if source == "voice":
+            mood["transcript"] = transcript
+        mood_list.append(mood)
+    if voice_bytes is not None and not transcript:
+        mood_list.append(dict(SILENT_MOOD))
+
+    # The lexicon blend is reproducible, so it wins whenever FUSION_MODE allows;
+    # the profile Gemini returned alongside the moods covers unknown mood words.
+    profile = await asyncio.to_thread(try_local_fusion, mood_list)
+    if profile is None:
+        profile = dict(reply["profile"])
+        profile["sources"] = [m["source"] for m in mood_list]
+    # Learned knowledge reads the feedback files: keep that disk I/O off the shared event loop
+    return mood_list, await asyncio.to_thread(apply_learned_knowledge, profile)
+
+
+async def _analyze_separate(text, image_bytes, voice_bytes):
+    analyses = []
+    if text:
+        analyses.append(analyze_text_async(text))
+    if image_bytes is not None:
+        analyses.append(analyze_image_async(image_bytes))
+    if voice_bytes is not None:
+        analyses.append(analyze_voice_async(voice_bytes))
+    mood_list = list(await asyncio.gather(*analyses))
+    return mood_list, await fuse_emotions_async(mood_list)
+
+
+async def analyze_inputs(text=None, image_bytes=None, voice_bytes=None):
+    """Analyze every provided input and fuse them. Returns (mood_list, ai_profile).
+
+    In combined mode all inputs go to Gemini in one request that returns the
+    per-source moods and the fused profile together; if that call fails for any
+    reason (API error, timeout, unusable reply), the per-source analyzers plus
+    fuse_emotions run instead.
+    """
+    if ANALYSIS_MODE == "combined":
+        try:
+            return await _analyze_combined(text, image_bytes, voice_bytes)
+        except Exception as e:
+            print(f"Combined analysis failed ({type(e).__name__}: {e}), falling back to per-source analysis")
+    elif ANALYSIS_MODE != "separate":
+        raise RuntimeError(f"Unknown ANALYSIS_MODE '{ANALYSIS_MODE}' (choose from combined, separate)")
+    return await _analyze_separate(text, image_bytes, voice_bytes)
@@ -1,24 +1,134 @@
+import base64
+import contextlib
 import io
+import json
 import os
+import threading
+from multiprocessing.connection import Client
+from queue import Queue
+import numpy as np
 import scipy.io.wavfile
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
+import torch
+from transformers import AutoProcessor, LogitsProcessor, LogitsProcessorList, MusicgenForConditionalGeneration
+from modules.audio_cache import cache_key, get_cached, put_cached
 
 MODEL_ID = os.getenv("HF_MODEL_ID", "facebook/musicgen-small")
+STREAM_PLAY_STEPS = int(os.getenv("MUSICGEN_STREAM_STEPS", "50"))  # ~1s of audio per segment
+SERVICE_ADDR = os.getenv("MUSICGEN_SERVICE", "")  # host:port of modules.generation_service, if running
+# Shared secret for the service; if unset, the service writes a random one here for local clients to read
+SERVICE_KEY_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "musicgen_service.key")
+DETERMINISTIC = os.getenv("MUSICGEN_DETERMINISTIC", "0") == "1"  # seed from prompt so repeats hit the cache
+INFERENCE_PROFILE = os.getenv("MUSICGEN_PROFILE", "default")
+TORCH_THREADS = int(os.getenv("MUSICGEN_THREADS", "0"))  # 0 = leave torch's default
+
+# CPU inference profiles — compare them with `python -m benchmarks.inference_profiles`
+INFERENCE_PROFILES = {
+    "baseline": {"inference_mode": False, "dtype": "float32", "quantize": False, "compile": False},
+    "default": {"inference_mode": True, "dtype": "float32", "quantize": False, "compile": False},
+    "bf16": {"inference_mode": True, "dtype": "bfloat16", "quantize": False, "compile": False},
+    "int8": {"inference_mode": True, "dtype": "float32", "quantize": True, "compile": False},
+    "int8-compiled": {"inference_mode": True, "dtype": "float32", "quantize": True, "compile": True},
+}
+CACHE_MODEL_ID = f"{MODEL_ID}:{INFERENCE_PROFILE}"  # Profiles change the audio, so cache them apart
 
 _model = None
 _processor = None
+_load_lock = threading.Lock()
+
+# MusicGen samples from torch's process-wide RNG; see _sampling_rng
+_seeded_lock = threading.Lock()  # One seeded generation at a time
+_rng_lock = threading.Lock()  # Guards the counters below
+_unseeded_running = 0
+_unseeded_started = 0  # Only grows; lets a seeded run notice anyone else drawing from the RNG
 
 
 def _load_model():
     global _model, _processor
-    if _model is None:
-        print(f"Loading {MODEL_ID}... (first time takes ~1-2 min to download)")
-        _processor = AutoProcessor.from_pretrained(MODEL_ID)
-        _model = MusicgenForConditionalGeneration.from_pretrained(MODEL_ID)
-        print("Model loaded.")
+    with _load_lock:  # Background preload and the first request may race here
+        if _model is None:
+            print(f"Loading {MODEL_ID}... (first time takes ~1-2 min to download)")
+            _processor = AutoProcessor.from_pretrained(MODEL_ID)
+            _model = _apply_profile(MusicgenForConditionalGeneration.from_pretrained(MODEL_ID))
+            print(f"Model loaded ({INFERENCE_PROFILE} profile).")
     return _model, _processor
 
 
+def _get_profile():
+    if INFERENCE_PROFILE not in INFERENCE_PROFILES:
+        raise RuntimeError(
+            f"Unknown MUSICGEN_PROFILE '{INFERENCE_PROFILE}' (choose from {', '.join(INFERENCE_PROFILES)})"
+        )
+    return INFERENCE_PROFILES[INFERENCE_PROFILE]
+
+
+def _apply_profile(model):
+    """Set threads, dtype, quantization and compilation for the configured profile.
+
+    Only the text encoder, projection and token decoder are converted; the EnCodec
+    audio decoder stays float32 so the waveform math is unchanged.
+    """
+    profile = _get_profile()
+    if TORCH_THREADS:
+        torch.set_num_threads(TORCH_THREADS)
+    model.eval()
+
+    if profile["dtype"] == "bfloat16":
+        for name, part in model.named_children():
+            if name != "audio_encoder":
+                part.to(torch.bfloat16)
+    if profile["quantize"]:
+        model.decoder = torch.ao.quantization.quantize_dynamic(
+            model.decoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    if profile["compile"]:
+        model.decoder.forward = torch.compile(model.decoder.forward, dynamic=True)
+    return model
+
+
+def _inference_context():
+    """torch.inference_mode() unless the profile turns it off. Thread-local, so enter it on the generating thread."""
+    return torch.inference_mode() if _get_profile()["inference_mode"] else contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _sampling_rng(seed):
+    """Scope one generation's use of torch's global RNG (generate() takes no per-call generator).
+
+    Seeded runs are serialized and fork the RNG, so the reseed never leaks into
+    other sessions' sampling. Once the block exits, the yielded dict's
+    "reproducible" says whether the output really follows from the seed: False
+    if unseeded, or if an unseeded generation on another thread drew from the
+    RNG meanwhile.
+    """
+    global _unseeded_running, _unseeded_started
+    run = {"reproducible": False}
+    if seed is None:
+        with _rng_lock:
+            _unseeded_running += 1
+            _unseeded_started += 1
+        try:
+            yield run
+        finally:
+            with _rng_lock:
+                _unseeded_running -= 1
+        return
+
+    with _seeded_lock, torch.random.fork_rng():
+        with _rng_lock:
+            alone = _unseeded_running == 0
+            started = _unseeded_started
+        torch.manual_seed(seed)
+        yield run
+        with _rng_lock:
+            run["reproducible"] = alone and _unseeded_started == started
+
+
+def warm_up():
+    """Load the model and run a tiny generation so the first real request skips kernel/allocator setup."""
+    _load_model()
+    _generate_batch(["warm up"], max_new_tokens=8)
+
+
 def _to_wav_bytes(audio_numpy, sample_rate):
     """Convert numpy audio array to WAV bytes."""
     buf = io.BytesIO()
@@ -26,26 +136,235 @@ def _to_wav_bytes(audio_numpy, sample_rate):
     return buf.getvalue()
 
 
-def generate_music(prompt, num_variations=2, max_new_tokens=128):
-    """Generate variations from a prompt in a single batched call. Returns list of wav byte buffers."""
-    model, processor = _load_model()
-
+def _variation_prompts(prompt, num_variations):
+    """Expand one prompt into the batch of A/B variation prompts."""
     prompts = [prompt]
     if num_variations >= 2:
         prompts.append(prompt + " with subtle variation in rhythm and texture")
+    return prompts
 
-    inputs = processor(text=prompts, padding=True, return_tensors="pt")
-    audio_values = model.generate(**inputs, do_sample=True, max_new_tokens=max_new_tokens)
 
-    sample_rate = model.config.audio_encoder.sampling_rate
+def _to_wav_list(audio_values, sample_rate):
+    """Convert a batch of generated audio (batch, channels, samples) to WAV byte buffers."""
     results = []
     for i in range(audio_values.shape[0]):
         audio_numpy = audio_values[i, 0].cpu().numpy()
         results.append(_to_wav_bytes(audio_numpy, sample_rate))
+    return results
+
+
+class _AudioStreamer(LogitsProcessor):
+    """Watches MusicGen's tokens and decodes finished audio every `play_steps` tokens.
+
+    It hooks in as a logits processor, which sees every token generated so far at
+    each step: MusicgenForConditionalGeneration.generate does not pass `streamer`
+    through to its sampling loop in recent transformers releases.
+
+    Decoded segments (one numpy array per batch item) are pushed onto `segments`.
+    The last `stride` samples of each window are held back because they still
+    change once the delayed codebooks for those frames arrive.
+    """
+
+    def __init__(self, model, play_steps):
+        self.decoder = model.decoder
+        self.audio_encoder = model.audio_encoder
+        self.start_token_id = model.generation_config.decoder_start_token_id
+        self.pad_token_id = model.generation_config.pad_token_id
+        self.play_steps = play_steps
+        hop_length = int(np.prod(self.audio_encoder.config.upsampling_ratios))
+        self.stride = max(hop_length * (play_steps - self.decoder.num_codebooks) // 6, 0)
+        self.emitted = 0
+        self.segments = Queue()
+
+    def _decode(self, input_ids):
+        num_codebooks = self.decoder.num_codebooks
+        _, delay_mask = self.decoder.build_delay_pattern_mask(
+            input_ids[:, :1], pad_token_id=self.start_token_id, max_length=input_ids.shape[-1]
+        )
+        input_ids = self.decoder.apply_delay_pattern_mask(input_ids, delay_mask)
+        batch_size = input_ids.shape[0] // num_codebooks
+        input_ids = input_ids[input_ids != self.pad_token_id].reshape(batch_size, num_codebooks, -1)
+        with torch.no_grad():
+            audio = self.audio_encoder.decode(input_ids[None, ...], audio_scales=[None] * batch_size).audio_values
+        return audio[:, 0].float().cpu().numpy()
+
+    def __call__(self, input_ids, scores):
+        """Called before each new token is sampled; input_ids holds every token so far. Scores pass through."""
+        steps = input_ids.shape[-1]
+        # Multi-channel models interleave codebooks; those only get the final decode
+        if steps % self.play_steps or steps <= self.decoder.num_codebooks or self.decoder.config.audio_channels != 1:
+            return scores
+        audio = self._decode(input_ids.cpu())
+        end = audio.shape[-1] - self.stride
+        if end > self.emitted:
+            self.segments.put(list(audio[:, self.emitted:end]))
+            self.emitted = end
+        # No flush at the end: the tail is taken from the full decode `generate` returns
+        return scores
+
+
+def _service_address():
+    """Parse MUSICGEN_SERVICE ("host:port" or ":port") into a Listener/Client address."""
+    host, _, port = SERVICE_ADDR.rpartition(":")
+    return (host or "localhost", int(port))
+
+
+def service_key():
+    """MUSICGEN_SERVICE_KEY, or the key a service on this machine generated into SERVICE_KEY_PATH."""
+    key = os.getenv("MUSICGEN_SERVICE_KEY")
+    if key:
+        return key.encode()
+    try:
+        with open(os.path.abspath(SERVICE_KEY_PATH), "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(
+            "No generation service key: set MUSICGEN_SERVICE_KEY, or start the service on this machine first"
+        ) from None
 
+
+def _generate_remote(prompt, num_variations, params):
+    """Hand the request to the shared generation service and wait for its WAV bytes.
+
+    Messages are JSON (WAV bytes base64-encoded), never pickles.
+    """
+    with Client(_service_address(), authkey=service_key()) as conn:
+        conn.send_bytes(json.dumps({"prompt": prompt, "num_variations": num_variations, **params}).encode())
+        reply = json.loads(conn.recv_bytes())
+    if "error" in reply:
+        raise RuntimeError(f"Generation service failed: {reply['error']}")
+    return [base64.b64decode(audio) for audio in reply["audio"]]
+
+
+def _sampling_params(prompt, num_variations, max_new_tokens, temperature, guidance_scale, seed):
+    """Collect generation settings, deriving a seed from them in deterministic mode."""
+    params = {
+        "max_new_tokens": max_new_tokens,
+        "temperature": temperature,
+        "guidance_scale": guidance_scale,
+        "seed": seed,
+    }
+    if seed is None and DETERMINISTIC:
+        params["seed"] = int(cache_key(CACHE_MODEL_ID, prompt, num_variations, params)[:8], 16)
+    return params
+
+
+def _generate_batch(prompts, max_new_tokens, temperature=1.0, guidance_scale=3.0, seed=None):
+    """Run one padded forward pass over any number of prompts.
+
+    Returns (one wav buffer per prompt, whether the result is reproducible from seed).
+    """
+    model, processor = _load_model()
+
+    inputs = processor(text=prompts, padding=True, return_tensors="pt")
+    with _sampling_rng(seed) as run, _inference_context():
+        audio_values = model.generate(
+            **inputs, do_sample=True, max_new_tokens=max_new_tokens,
+            temperature=temperature, guidance_scale=guidance_scale,
+        )
+
+    return _to_wav_list(audio_values, model.config.audio_encoder.sampling_rate), run["reproducible"]
+
+
+def generate_music(prompt, num_variations=2, max_new_tokens=128, temperature=1.0, guidance_scale=3.0, seed=None):
+    """Generate variations from a prompt in a single batched call. Returns list of wav byte buffers.
+
+    Seeded requests (explicit `seed`, or MUSICGEN_DETERMINISTIC=1) are served from
+    the on-disk audio cache when the same prompt and settings were generated before.
+    """
+    params = _sampling_params(prompt, num_variations, max_new_tokens, temperature, guidance_scale, seed)
+    key = cache_key(CACHE_MODEL_ID, prompt, num_variations, params) if params["seed"] is not None else None
+    if key:
+        cached = get_cached(key)
+        if cached:
+            return cached
+
+    if SERVICE_ADDR:
+        # The service samples one batch at a time, and seeded jobs are never batched with others
+        results, reproducible = _generate_remote(prompt, num_variations, params), True
+    else:
+        results, reproducible = _generate_batch(_variation_prompts(prompt, num_variations), **params)
+
+    if key and reproducible:
+        put_cached(key, results)
     return results
 
 
+def generate_music_stream(prompt, num_variations=2, max_new_tokens=128, temperature=1.0, guidance_scale=3.0,
+                          seed=None, play_steps=STREAM_PLAY_STEPS):
+    """Streaming version of generate_music.
+
+    Yields a list of float32 numpy segments (one per variation) each time a window
+    of `play_steps` tokens is decoded. The generator's return value (StopIteration.value)
+    is the same list of WAV byte buffers generate_music returns. Cache hits and
+    requests sent to a generation service yield nothing; the audio comes back in one piece.
+    """
+    params = _sampling_params(prompt, num_variations, max_new_tokens, temperature, guidance_scale, seed)
+    key = cache_key(CACHE_MODEL_ID, prompt, num_variations, params) if params["seed"] is not None else None
+    if key:
+        cached = get_cached(key)
+        if cached:
+            return cached
+    if SERVICE_ADDR:
+        results = _generate_remote(prompt, num_variations, params)
+        if key:
+            put_cached(key, results)
+        return results
+
+    model, processor = _load_model()
+
+    inputs = processor(text=_variation_prompts(prompt, num_variations), padding=True, return_tensors="pt")
+    streamer = _AudioStreamer(model, play_steps)
+    outcome = {}
+
+    def _run():
+        try:
+            with _sampling_rng(params["seed"]) as run, _inference_context():
+                outcome["audio"] = model.generate(
+                    **inputs, do_sample=True, max_new_tokens=max_new_tokens,
+                    temperature=temperature, guidance_scale=guidance_scale,
+                    logits_processor=LogitsProcessorList([streamer]),
+                )
+            outcome["reproducible"] = run["reproducible"]
+        except Exception as exc:
+            outcome["error"] = exc
+        finally:
+            streamer.segments.put(None)
+
+    worker = threading.Thread(target=_run, daemon=True)
+    worker.start()
+    while True:
+        segments = streamer.segments.get()
+        if segments is None:
+            break
+        yield segments
+    worker.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    audio_values = outcome["audio"]
+    tail = audio_values[:, 0, streamer.emitted:].float().cpu().numpy()
+    if tail.shape[-1]:
+        yield list(tail)
+    results = _to_wav_list(audio_values, model.config.audio_encoder.sampling_rate)
+    if key and outcome["reproducible"]:
+        put_cached(key, results)
+    return results
+
+
+def segments_to_wav(segments):
+    """Join streamed numpy segments into WAV bytes at the model's sample rate."""
+    model, _ = _load_model()
+    return _to_wav_bytes(np.concatenate(segments), model.config.audio_encoder.sampling_rate)
+
+
+def segments_seconds(segments):
+    """Playback length of streamed numpy segments."""
+    model, _ = _load_model()
+    return sum(len(s) for s in segments) / model.config.audio_encoder.sampling_rate
+
+
 if __name__ == "__main__":
     test_prompt = "A gentle lo-fi piano melody with warm vinyl crackle and soft drums"
     print(f"Testing with prompt: {test_prompt}")
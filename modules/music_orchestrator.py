@@ -1,6 +1,7 @@
 from utils.llm_client import ask_text
 from modules.feedback import (
     get_top_prompts,
+    get_similar_prompts,
     get_negative_examples,
     get_emotion_profile,
     get_learned_rules,
@@ -39,12 +40,16 @@ def _map_arc(val):
     return "starts quiet, massive build, explosive climax, drop"
 
 
-def _build_knowledge_context(emotion):
-    """Assemble learned knowledge for injection into prompt generation."""
+def build_knowledge_context(emotion, profile=None):
+    """Assemble learned knowledge for injection into prompt generation.
+
+    With a profile, the few-shot examples are the well-rated sessions closest
+    to its sliders rather than simply the newest well-rated ones.
+    """
     sections = []
 
     # Positive examples (few-shot)
-    top_prompts = get_top_prompts(emotion)
+    top_prompts = get_similar_prompts(profile) if profile is not None else get_top_prompts(emotion)
     if top_prompts:
         sections.append(
             "Prompts that scored well for this emotion — use as inspiration:\n"
@@ -94,8 +99,11 @@ def _build_knowledge_context(emotion):
     return "\n\n".join(sections)
 
 
-def create_music_prompt(final_profile):
-    """Convert a final_profile dict into a vivid MusicGen prompt string."""
+def create_music_prompt(final_profile, knowledge=None):
+    """Convert a final_profile dict into a vivid MusicGen prompt string.
+
+    Pass `knowledge` (from build_knowledge_context) if it was already assembled.
+    """
     emotion = final_profile.get("emotion", "neutral")
     energy_desc = _map_energy(final_profile.get("energy", 50))
     style_desc = _map_style(final_profile.get("style", 50))
@@ -103,7 +111,8 @@ def create_music_prompt(final_profile):
     arc_desc = _map_arc(final_profile.get("arc", 50))
 
     # Build knowledge context from feedback loop
-    knowledge = _build_knowledge_context(emotion)
+    if knowledge is None:
+        knowledge = build_knowledge_context(emotion, final_profile)
     knowledge_block = f"\n\n{knowledge}" if knowledge else ""
 
     prompt = f"""You are a music director creating a prompt for an AI music generator.
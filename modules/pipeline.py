@@ -0,0 +1,82 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+
+# One pool for the whole process: sessions share worker threads instead of
+# spinning up (and tearing down) a fresh pool per Generate click.
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="stage")
+
+
+def stage(fn, deps=(), inline=False):
+    """Describe one pipeline stage.
+
+    fn is called with the results of its dependencies as keyword arguments.
+    Inline stages run on the calling thread (needed for anything that draws
+    Streamlit elements); the rest run on a worker pool.
+    """
+    return {"fn": fn, "deps": list(deps), "inline": inline}
+
+
+def run_stages(stages, on_event=None):
+    """Run a DAG of stages, starting each one as soon as its dependencies finish.
+
+    Returns (results, timings) where timings maps stage name to
+    {"start": seconds after launch, "duration": seconds}. on_event(name, "start"/"done")
+    is always called on the calling thread. The first stage to raise aborts the run.
+    """
+    for name, spec in stages.items():
+        missing = [d for d in spec["deps"] if d not in stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+
+    results, timings = {}, {}
+    pending = dict(stages)
+    running = {}
+    t0 = time.perf_counter()
+
+    def _ready():
+        return [n for n, s in pending.items() if all(d in results for d in s["deps"])]
+
+    def _timed(name, spec):
+        started = time.perf_counter()
+        value = spec["fn"](**{d: results[d] for d in spec["deps"]})
+        timings[name] = {"start": round(started - t0, 3), "duration": round(time.perf_counter() - started, 3)}
+        return value
+
+    def _notify(name, event):
+        if on_event:
+            on_event(name, event)
+
+    while pending or running:
+        ready = _ready()
+        for name in [n for n in ready if not pending[n]["inline"]]:
+            spec = pending.pop(name)
+            _notify(name, "start")
+            running[_executor.submit(_timed, name, spec)] = name
+
+        inline = [n for n in ready if n in pending]
+        if inline:
+            # Pool stages keep running while the caller's thread does this one
+            name = inline[0]
+            spec = pending.pop(name)
+            _notify(name, "start")
+            results[name] = _timed(name, spec)
+            _notify(name, "done")
+        elif running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                _notify(name, "done")
+        elif pending:
+            raise ValueError(f"Dependency cycle between stages: {', '.join(pending)}")
+
+        # Collect pool stages that finished while an inline stage ran
+        for future in [f for f in running if f.done()]:
+            name = running.pop(future)
+            results[name] = future.result()
+            _notify(name, "done")
+
+    return results, timings
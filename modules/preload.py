@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from modules import music_generator, voice_analyzer
+
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
+
+_status = {
+    "musicgen": "pending",
+    "whisper": "pending",
+}
+_errors = {}
+_started = False
+_lock = threading.Lock()
+
+
+def _warm(name, warm_up):
+    _status[name] = "loading"
+    started = time.perf_counter()
+    try:
+        warm_up()
+    except Exception as exc:
+        _status[name] = "failed"
+        _errors[name] = str(exc)
+        print(f"Preload of {name} failed: {exc}")
+        return
+    _status[name] = "ready"
+    print(f"Preloaded {name} in {time.perf_counter() - started:.1f}s")
+
+
+def _preload():
+    if music_generator.SERVICE_ADDR:
+        _status["musicgen"] = "skipped"  # The generation service owns the model
+    else:
+        _warm("musicgen", music_generator.warm_up)
+    _warm("whisper", voice_analyzer.warm_up)
+
+
+def start_preload():
+    """Load and warm up MusicGen and Whisper on a background thread, once per process."""
+    global _started
+    with _lock:
+        if _started or not PRELOAD_MODELS:
+            return
+        _started = True
+    threading.Thread(target=_preload, name="model-preload", daemon=True).start()
+
+
+def get_preload_status():
+    """Return per-model state (pending/loading/ready/failed/skipped), overall readiness and any failures.
+
+    "failed" lists models whose preload raised; they are loaded again on first use.
+    """
+    status = dict(_status)
+    return {
+        "enabled": PRELOAD_MODELS,
+        "models": status,
+        "errors": dict(_errors),
+        "ready": all(s in ("ready", "skipped") for s in status.values()),
+        "failed": [name for name, s in status.items() if s == "failed"],
+        "loading": any(s in ("pending", "loading") for s in status.values()),
+    }
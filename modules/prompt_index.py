@@ -0,0 +1,244 @@
+"""Nearest-neighbour index over past sessions, for picking few-shot prompt examples.
+
+Each session with a music prompt is filed under its canonical emotion and a
+coarse grid cell of its four slider values (energy, style, warmth, arc). A
+query only visits the cells around the current profile, widening ring by ring
+until the k nearest are certain, so its cost follows the neighbourhood rather
+than the size of the history. Among the nearest, prompts that say nearly the
+same thing as one already picked (hashed TF-IDF cosine) are skipped.
+"""
+import itertools
+import math
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from modules.feedback_store import entries_since, entries_at
+from modules.emotion_vocab import canonical_emotion, VOCAB_VERSION
+
+PROMPT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "prompt_index.npz")
+PROMPT_DEDUP_THRESHOLD = float(os.getenv("PROMPT_DEDUP_THRESHOLD", "0.8"))  # TF-IDF cosine; 1 keeps near-duplicates
+
+DIMENSIONS = ["energy", "style", "warmth", "arc"]
+CELL_SIZE = 20  # Slider units per grid cell along each dimension
+_BINS = 100 // CELL_SIZE  # Cells per dimension; 100 falls in the last one
+_TEXT_DIMS = 4096  # Hashed vocabulary size for prompt TF-IDF
+_CANDIDATES_PER_RESULT = 4  # Nearest sessions considered per example, so duplicates can be skipped
+_SAVE_EVERY = 25  # Persist after this many new sessions; anything later is re-read from the log on load
+
+_lock = threading.Lock()
+_index = None
+
+
+def _empty_index():
+    return {
+        "entries": 0,  # Log entries folded in so far
+        "saved": 0,  # Value of "entries" when last persisted
+        "size": 0,  # Indexed sessions (entries with a prompt)
+        "positions": np.zeros(64, dtype=np.int64),  # Log position of each indexed session
+        "ratings": np.zeros(64, dtype=np.int8),
+        "sliders": np.zeros((64, len(DIMENSIONS)), dtype=np.float32),
+        "emotion_ids": np.zeros(64, dtype=np.int32),
+        "emotions": [],  # emotion id -> canonical emotion
+        "doc_freq": np.zeros(_TEXT_DIMS, dtype=np.int32),  # Prompts containing each hashed term
+        # Derived on load, not persisted:
+        "emotion_lookup": {},  # canonical emotion -> emotion id
+        "cells": {},  # emotion id -> grid cell -> [row]
+    }
+
+
+def _cell_of(sliders):
+    return tuple(min(int(v) // CELL_SIZE, _BINS - 1) for v in sliders)
+
+
+def _sliders_of(profile):
+    values = []
+    for dim in DIMENSIONS:
+        value = profile.get(dim, 50)
+        values.append(min(max(float(value), 0.0), 100.0) if isinstance(value, (int, float)) else 50.0)
+    return values
+
+
+def _terms(text):
+    return {zlib.crc32(word.encode("utf-8")) % _TEXT_DIMS for word in re.findall(r"[a-z]+", text.lower())}
+
+
+def _grow(index):
+    capacity = max(len(index["positions"]) * 2, 64)
+    for key in ["positions", "ratings", "sliders", "emotion_ids"]:
+        old = index[key]
+        index[key] = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+        index[key][:len(old)] = old
+
+
+def _add_row(index, row):
+    cell = _cell_of(index["sliders"][row])
+    index["cells"].setdefault(int(index["emotion_ids"][row]), {}).setdefault(cell, []).append(row)
+
+
+def _fold(index, entry, position):
+    prompt = entry.get("music_prompt")
+    fp = entry.get("final_profile") or {}
+    if prompt and fp.get("emotion"):
+        emotion = canonical_emotion(fp["emotion"])
+        if emotion not in index["emotion_lookup"]:
+            index["emotion_lookup"][emotion] = len(index["emotions"])
+            index["emotions"].append(emotion)
+        row = index["size"]
+        if row == len(index["positions"]):
+            _grow(index)
+        index["positions"][row] = position
+        index["ratings"][row] = entry.get("rating", 0)
+        index["sliders"][row] = _sliders_of(fp)
+        index["emotion_ids"][row] = index["emotion_lookup"][emotion]
+        index["size"] += 1
+        index["doc_freq"][list(_terms(prompt))] += 1
+        _add_row(index, row)
+    index["entries"] += 1
+
+
+def _load():
+    path = os.path.abspath(PROMPT_INDEX_PATH)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["vocab"]) != VOCAB_VERSION:
+                return _empty_index()  # Filed under another vocabulary: rebuild from the log
+            index = _empty_index()
+            index["entries"] = index["saved"] = int(data["entries"])
+            index["size"] = len(data["positions"])
+            for key in ["positions", "ratings", "sliders", "emotion_ids", "doc_freq"]:
+                index[key] = data[key].copy()
+            index["emotions"] = [str(e) for e in data["emotions"]]
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return _empty_index()
+    index["emotion_lookup"] = {e: i for i, e in enumerate(index["emotions"])}
+    for row in range(index["size"]):
+        _add_row(index, row)
+    return index
+
+
+def _save(index):
+    path = os.path.abspath(PROMPT_INDEX_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    size = index["size"]
+    with open(tmp, "wb") as f:
+        np.savez(
+            f, vocab=VOCAB_VERSION, entries=index["entries"],
+            positions=index["positions"][:size], ratings=index["ratings"][:size],
+            sliders=index["sliders"][:size], emotion_ids=index["emotion_ids"][:size],
+            emotions=np.array(index["emotions"], dtype=str), doc_freq=index["doc_freq"],
+        )
+    os.replace(tmp, path)
+    index["saved"] = index["entries"]
+
+
+def _sync():
+    """Fold in log entries the index hasn't seen yet. Caller holds _lock."""
+    global _index
+    if _index is None:
+        _index = _load()
+    new = entries_since(_index["entries"])
+    if new is None:  # Log is shorter than what we indexed: it was replaced, so rebuild
+        _index = _empty_index()
+        new = entries_since(0)
+    for entry in new:
+        _fold(_index, entry, _index["entries"])
+
+
+def update():
+    """Bring the index up to date with the feedback log, persisting every _SAVE_EVERY entries."""
+    with _lock:
+        _sync()
+        if _index["entries"] - _index["saved"] >= _SAVE_EVERY:
+            _save(_index)
+
+
+def _ring(cells, center, radius):
+    """Rows in the cells exactly `radius` cells away from center (Chebyshev distance)."""
+    def distance(cell):
+        return max(abs(a - b) for a, b in zip(cell, center))
+
+    ring_size = (2 * radius + 1) ** len(center) - (2 * radius - 1) ** len(center) if radius else 1
+    if len(cells) <= ring_size:
+        # Sparse emotion: cheaper to check each occupied cell than to enumerate the ring
+        return [row for cell, rows in cells.items() if distance(cell) == radius for row in rows]
+    spans = [range(max(c - radius, 0), min(c + radius, _BINS - 1) + 1) for c in center]
+    return [row for cell in itertools.product(*spans) if distance(cell) == radius for row in cells.get(cell, ())]
+
+
+def _nearest_rows(emotion, sliders, want, min_rating):
+    """Up to `want` rows for emotion with rating >= min_rating, nearest first. Caller holds _lock."""
+    emotion_id = _index["emotion_lookup"].get(canonical_emotion(emotion))
+    if emotion_id is None:
+        return []
+    cells = _index["cells"].get(emotion_id, {})
+    query = np.array(sliders, dtype=np.float32)
+    center = _cell_of(sliders)
+    rows = []
+    for radius in range(_BINS):
+        ring = [row for row in _ring(cells, center, radius) if _index["ratings"][row] >= min_rating]
+        rows.extend(ring)
+        if len(rows) < want:
+            continue
+        distances = np.linalg.norm(_index["sliders"][rows] - query, axis=1)
+        # Anything outside the rings searched so far is at least radius cells away
+        if np.partition(distances, want - 1)[want - 1] <= radius * CELL_SIZE:
+            break
+    if not rows:
+        return []
+    rows = np.array(rows)
+    distances = np.linalg.norm(_index["sliders"][rows] - query, axis=1)
+    # Nearest first; ties go to the better rating, then the newer session
+    order = np.lexsort((-_index["positions"][rows], -_index["ratings"][rows], distances))
+    return rows[order[:want]].tolist()
+
+
+def _tfidf(terms, idf):
+    vec = {t: idf[t] for t in terms}
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    return {t: v / norm for t, v in vec.items()} if norm else vec
+
+
+def nearest_prompts(profile, k=3, min_rating=4):
+    """Music prompts from the k well-rated sessions nearest to profile.
+
+    Sessions must share the profile's canonical emotion; nearness is slider
+    distance. A prompt too similar to one already picked is skipped in favour
+    of the next nearest, widening the search as needed; only if the emotion has
+    fewer than k distinct-enough prompts do skipped ones fill the remaining slots.
+    """
+    emotion, sliders = profile.get("emotion", ""), _sliders_of(profile)
+    picked, vectors, skipped = [], [], []
+    seen = set()
+    want = k * _CANDIDATES_PER_RESULT
+    while True:
+        with _lock:
+            _sync()
+            rows = _nearest_rows(emotion, sliders, want, min_rating)
+            positions = _index["positions"][rows].tolist()
+            idf = np.log((1 + _index["size"]) / (1 + _index["doc_freq"])) + 1
+
+        fresh = [p for p in positions if p not in seen]
+        seen.update(fresh)
+        for entry in entries_at(fresh):
+            prompt = entry.get("music_prompt")
+            vec = _tfidf(_terms(prompt), idf)
+            if any(sum(w * other.get(t, 0.0) for t, w in vec.items()) >= PROMPT_DEDUP_THRESHOLD for other in vectors):
+                skipped.append(prompt)
+                continue
+            picked.append(prompt)
+            vectors.append(vec)
+            if len(picked) == k:
+                return picked
+        if len(rows) < want:
+            break  # Every matching session has been considered
+        want *= _CANDIDATES_PER_RESULT
+
+    for prompt in skipped:
+        if len(picked) == k:
+            break
+        if prompt not in picked:
+            picked.append(prompt)
+    return picked
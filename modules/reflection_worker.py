@@ -0,0 +1,125 @@
+"""Background reflection: saving feedback never waits on Gemini.
+
+Requests go into a queue drained by one daemon thread. Requests that arrive
+while a reflection is queued or running coalesce into a single follow-up run,
+and an flock on REFLECTION_LOCK_PATH keeps two app processes from reflecting
+at the same time.
+
+    python -m modules.reflection_worker           # run an (incremental) reflection now, e.g. from cron
+    python -m modules.reflection_worker --full    # rebuild everything from the whole feedback log
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight within this process only
+    fcntl = None
+
+REFLECTION_LOCK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "reflection.lock")
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+_queued = False  # A request is waiting in _queue; later ones coalesce into it
+_idle = threading.Event()
+_idle.set()
+_status = {
+    "state": "idle",  # idle | queued | running
+    "runs": 0,  # Reflections that ran to completion
+    "skipped": 0,  # Dropped because another process was already reflecting
+    "failed": 0,
+    "last_started": None,
+    "last_duration_s": None,
+    "last_error": None,
+}
+
+
+def request_reflection(job):
+    """Queue job (the reflection callable) to run in the background; returns immediately."""
+    global _worker, _queued
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="reflection", daemon=True)
+            _worker.start()
+        if _queued:
+            return
+        _queued = True
+        _idle.clear()
+        if _status["state"] == "idle":
+            _status["state"] = "queued"
+    _queue.put(job)
+
+
+def get_reflection_status():
+    """Snapshot of the worker's state and its last run."""
+    with _lock:
+        return dict(_status)
+
+
+def wait_idle(timeout=None):
+    """Block until no reflection is queued or running. Returns False on timeout."""
+    return _idle.wait(timeout)
+
+
+def _run_worker():
+    global _queued
+    while True:
+        job = _queue.get()
+        with _lock:
+            _queued = False
+            _status["state"] = "running"
+            _status["last_started"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        started = time.perf_counter()
+        error = None
+        outcome = "runs"
+        try:
+            if not run_exclusive(job):
+                outcome = "skipped"
+        except Exception:
+            error = traceback.format_exc(limit=3)
+            outcome = "failed"
+            print(f"Reflection failed:\n{error}")
+        with _lock:
+            _status[outcome] += 1
+            _status["last_duration_s"] = round(time.perf_counter() - started, 2)
+            _status["last_error"] = error
+            _status["state"] = "queued" if _queued else "idle"
+            if not _queued:
+                _idle.set()
+
+
+def run_exclusive(job):
+    """Run job while holding the cross-process reflection lock.
+
+    Returns False without running it if another process is already reflecting;
+    that run sees the same feedback log, and the next rating re-triggers anyway.
+    """
+    path = os.path.abspath(REFLECTION_LOCK_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        try:
+            job()
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    from modules.feedback import run_reflection
+
+    full = "--full" in sys.argv[1:]
+    if run_exclusive(lambda: run_reflection(full=full)):
+        print("Reflection complete.")
+    else:
+        print("Another process is already reflecting.")
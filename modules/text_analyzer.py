@@ -1,9 +1,8 @@
-from utils.llm_client import ask_json
+from utils.llm_client import ask_json, ask_json_async
 
 
-def analyze_text(text):
-    """Analyze text input and return mood dict."""
-    prompt = f"""Analyze the following text for its emotional content.
+def _build_prompt(text):
+    return f"""Analyze the following text for its emotional content.
 Return ONLY a JSON object with these keys:
 - summary: one sentence summary
 - moods: a list of 1-3 emotion words detected (most dominant first)
@@ -17,6 +16,16 @@ Text: "{text}"
 
 Return ONLY valid JSON, no other text."""
 
-    result = ask_json(prompt)
+
+def analyze_text(text):
+    """Analyze text input and return mood dict."""
+    result = ask_json(_build_prompt(text))
+    result["source"] = "text"
+    return result
+
+
+async def analyze_text_async(text):
+    """Async analyze_text."""
+    result = await ask_json_async(_build_prompt(text))
     result["source"] = "text"
     return result
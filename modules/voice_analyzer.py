@@ -1,41 +1,210 @@
+import asyncio
+import hashlib
+import io
+import os
 import tempfile
+import threading
+from collections import OrderedDict
+from math import gcd
+import numpy as np
+import scipy.io.wavfile
+import scipy.signal
 import whisper
-from utils.llm_client import ask_json
+from utils.llm_client import ask_json, ask_json_async
+
+try:
+    import faster_whisper  # Optional CTranslate2 backend, int8 on CPU
+except ImportError:
+    faster_whisper = None
+
+STT_BACKEND = os.getenv("STT_BACKEND", "auto")  # auto | whisper | faster-whisper
+STT_MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "base")  # tiny | base | small
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "") or None  # e.g. "en"; None = auto-detect
+STT_VAD = os.getenv("STT_VAD", "1") == "1"  # trim silence before decoding
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "64"))  # recordings kept per process
+WHISPER_SAMPLE_RATE = 16000
 
 _whisper_model = None
+_whisper_lock = threading.Lock()
+
+# Transcripts by audio content hash, shared by transcribe_audio and analyze_voice
+_transcripts = OrderedDict()
+_in_flight = {}
+_transcripts_lock = threading.Lock()
+
+
+# --- Speech-to-text backends ---
+
+def _load_openai_whisper(size):
+    return whisper.load_model(size)
+
+
+def _run_openai_whisper(model, audio, language):
+    result = model.transcribe(audio, language=language, fp16=False)
+    return result.get("text", "")
+
+
+def _load_faster_whisper(size):
+    return faster_whisper.WhisperModel(size, device="cpu", compute_type="int8")
+
+
+def _run_faster_whisper(model, audio, language):
+    segments, _ = model.transcribe(audio, language=language, beam_size=1)
+    return "".join(segment.text for segment in segments)
+
+
+_BACKENDS = {
+    "whisper": (_load_openai_whisper, _run_openai_whisper),
+    "faster-whisper": (_load_faster_whisper, _run_faster_whisper),
+}
+
+
+def _backend_name():
+    if STT_BACKEND == "auto":
+        return "faster-whisper" if faster_whisper is not None else "whisper"
+    if STT_BACKEND not in _BACKENDS:
+        raise RuntimeError(f"Unknown STT_BACKEND '{STT_BACKEND}' (choose from auto, {', '.join(_BACKENDS)})")
+    if STT_BACKEND == "faster-whisper" and faster_whisper is None:
+        raise RuntimeError("STT_BACKEND=faster-whisper but the faster-whisper package is not installed")
+    return STT_BACKEND
 
 
 def _get_whisper():
+    """Load the configured speech-to-text model once. Returns (model, run_fn)."""
     global _whisper_model
-    if _whisper_model is None:
-        _whisper_model = whisper.load_model("base")
-    return _whisper_model
+    load, run = _BACKENDS[_backend_name()]
+    with _whisper_lock:
+        if _whisper_model is None:
+            _whisper_model = load(STT_MODEL_SIZE)
+    return _whisper_model, run
+
+
+def warm_up():
+    """Load the speech-to-text model and transcribe one second of silence to prime it."""
+    model, run = _get_whisper()
+    run(model, np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32), STT_LANGUAGE)
+
+
+def _trim_silence(audio, frame_ms=30, pad_ms=200, max_gap_ms=600):
+    """Energy-based VAD: drop leading/trailing silence and shorten long pauses.
+
+    A frame counts as speech if its RMS is within 30 dB of the loudest frame and
+    above -50 dBFS. Speech keeps pad_ms of context on each side, and a pause
+    between two stretches of speech is cut to at most max_gap_ms, padding
+    included. Returns an empty array if nothing qualifies.
+    """
+    frame = WHISPER_SAMPLE_RATE * frame_ms // 1000
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return audio
+    rms = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    threshold = max(rms.max() * 10 ** (-30 / 20), 10 ** (-50 / 20))
+    speech = rms >= threshold
+    if not speech.any():
+        return audio[:0]
+
+    # Pad speech by pad_ms on both sides. An interior pause already keeps a pad at
+    # each end, so at most max_gap_ms minus both pads of the silence between them survives
+    pad = max(pad_ms // frame_ms, 1)
+    keep = np.convolve(speech, np.ones(2 * pad + 1), mode="same") > 0
+    gap_limit = max(max_gap_ms // frame_ms - 2 * pad, 0)
+    run_length = np.zeros(n_frames, dtype=int)
+    for i in np.flatnonzero(~keep):
+        run_length[i] = run_length[i - 1] + 1 if i and not keep[i - 1] else 1
+    keep |= (run_length > 0) & (run_length <= gap_limit)
+    first, last = np.flatnonzero(speech)[[0, -1]]
+    keep[:max(first - pad, 0)] = False
+    keep[last + pad + 1:] = False
+
+    return audio[:n_frames * frame].reshape(n_frames, frame)[keep].reshape(-1)
 
 
 def transcribe_audio(audio_bytes):
-    """Transcribe audio bytes with Whisper. Returns the transcript string."""
-    model = _get_whisper()
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+    """Transcribe audio bytes with the configured backend. Returns the transcript string.
+
+    Each distinct recording is transcribed once; repeats (Streamlit reruns,
+    analyze_voice after the live transcript) come from an LRU cache. Concurrent
+    calls for the same recording wait for the first one instead of re-running Whisper.
+    """
+    key = hashlib.sha256(audio_bytes).hexdigest()
+    while True:
+        with _transcripts_lock:
+            if key in _transcripts:
+                _transcripts.move_to_end(key)
+                return _transcripts[key]
+            pending = _in_flight.get(key)
+            if pending is None:
+                pending = _in_flight[key] = threading.Event()
+                break
+        pending.wait()
+
+    try:
+        transcript = _transcribe(audio_bytes)
+        with _transcripts_lock:
+            _transcripts[key] = transcript
+            while len(_transcripts) > TRANSCRIPT_CACHE_SIZE:
+                _transcripts.popitem(last=False)
+    finally:
+        with _transcripts_lock:
+            del _in_flight[key]
+        pending.set()
+    return transcript
+
+
+def _decode_wav(audio_bytes):
+    """Decode WAV bytes into the mono 16 kHz float32 array Whisper expects. Returns None if not a WAV."""
+    try:
+        sample_rate, audio = scipy.io.wavfile.read(io.BytesIO(audio_bytes))
+    except ValueError:
+        return None
+
+    if audio.dtype == np.uint8:
+        audio = (audio.astype(np.float32) - 128) / 128
+    elif np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    else:
+        audio = audio.astype(np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    if sample_rate != WHISPER_SAMPLE_RATE:
+        g = gcd(sample_rate, WHISPER_SAMPLE_RATE)
+        audio = scipy.signal.resample_poly(audio, WHISPER_SAMPLE_RATE // g, sample_rate // g)
+    return audio.astype(np.float32)
+
+
+def _transcribe(audio_bytes):
+    """Run the speech-to-text backend, decoding WAV in memory (no temp file, no ffmpeg)."""
+    model, run = _get_whisper()
+    audio = _decode_wav(audio_bytes)
+    if audio is not None:
+        if STT_VAD:
+            audio = _trim_silence(audio)
+            if not audio.size:
+                return ""  # Nothing but silence — skip decoding entirely
+        return run(model, audio, STT_LANGUAGE).strip()
+
+    # Not a WAV — let the backend's own ffmpeg/PyAV loader handle it, and clean up afterwards
+    with tempfile.NamedTemporaryFile(suffix=".audio", delete=False) as tmp:
         tmp.write(audio_bytes)
         tmp_path = tmp.name
-    result = model.transcribe(tmp_path)
-    return result.get("text", "").strip()
+    try:
+        return run(model, tmp_path, STT_LANGUAGE).strip()
+    finally:
+        os.remove(tmp_path)
 
 
-def analyze_voice(audio_bytes):
-    """Transcribe audio with Whisper, then analyze mood via Gemini. Returns mood dict."""
-    transcript = transcribe_audio(audio_bytes)
+SILENT_MOOD = {
+    "transcript": "",
+    "moods": ["neutral"],
+    "mood": "neutral",
+    "energy": 0.5,
+    "source": "voice",
+}
 
-    if not transcript:
-        return {
-            "transcript": "",
-            "moods": ["neutral"],
-            "mood": "neutral",
-            "energy": 0.5,
-            "source": "voice",
-        }
-
-    prompt = f"""Analyze the following spoken transcript for its emotional content.
+
+def _build_prompt(transcript):
+    return f"""Analyze the following spoken transcript for its emotional content.
 Return ONLY a JSON object with these keys:
 - moods: a list of 1-3 emotion words detected (most dominant first)
 - mood: the single most dominant mood (first item from moods)
@@ -48,7 +217,28 @@ Transcript: "{transcript}"
 
 Return ONLY valid JSON, no other text."""
 
-    mood = ask_json(prompt)
+
+def analyze_voice(audio_bytes):
+    """Transcribe audio with Whisper, then analyze mood via Gemini. Returns mood dict."""
+    transcript = transcribe_audio(audio_bytes)
+
+    if not transcript:
+        return dict(SILENT_MOOD)
+
+    mood = ask_json(_build_prompt(transcript))
+    mood["transcript"] = transcript
+    mood["source"] = "voice"
+    return mood
+
+
+async def analyze_voice_async(audio_bytes):
+    """Async analyze_voice. Transcription is CPU-bound, so it runs in a worker thread."""
+    transcript = await asyncio.to_thread(transcribe_audio, audio_bytes)
+
+    if not transcript:
+        return dict(SILENT_MOOD)
+
+    mood = await ask_json_async(_build_prompt(transcript))
     mood["transcript"] = transcript
     mood["source"] = "voice"
     return mood
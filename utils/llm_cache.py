@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("LLM_CACHE", "memory")  # memory | sqlite | off
+CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "llm_cache.sqlite")
+)
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds
+CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))  # in-memory entries
+DISK_CACHE_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", "10000"))  # SQLite entries
+
+
+def cache_key(model, prompt, image_bytes=None):
+    """Key a request by model, whitespace-normalized prompt and image content hash."""
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(" ".join(prompt.split()).encode("utf-8"))
+    h.update(b"\0")
+    if image_bytes:
+        h.update(hashlib.sha256(image_bytes).digest())
+    return h.hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe LRU of response texts with per-entry expiry."""
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache shared by every process on the host; evicts least recently used past max_size."""
+
+    def __init__(self, path=CACHE_PATH, max_size=DISK_CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class TieredCache:
+    """Memory LRU in front of a slower shared cache; disk hits are promoted to memory."""
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def __len__(self):
+        return len(self.disk)
+
+
+def build_default_cache():
+    """Build the cache selected by LLM_CACHE, or None if caching is off."""
+    if CACHE_BACKEND == "off":
+        return None
+    if CACHE_BACKEND == "sqlite":
+        return TieredCache(MemoryCache(), SQLiteCache())
+    if CACHE_BACKEND == "memory":
+        return MemoryCache()
+    raise RuntimeError(f"Unknown LLM_CACHE '{CACHE_BACKEND}' (choose from memory, sqlite, off)")
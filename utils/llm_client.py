@@ -1,13 +1,36 @@
+import asyncio
 import io
 import os
 import json
+import random
+import threading
+import httpx
 from dotenv import load_dotenv
 from google import genai
+from google.genai import errors, types
 from PIL import Image
+from utils.llm_cache import MemoryCache, build_default_cache, cache_key
 
 load_dotenv()
 
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "60"))  # per call, across all retries
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # in-flight Gemini requests per process
+
+_RETRY_BASE_S = 0.5
+_RETRY_CAP_S = 8.0
+
 _client = None
+_cache = build_default_cache()
+_cache_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+# All Gemini traffic runs on one long-lived event loop, so the async client's
+# HTTP connection pool and the concurrency limiter are shared by every caller.
+_loop = None
+_limiter = None
+_loop_lock = threading.Lock()
 
 
 def _get_client():
@@ -20,14 +43,163 @@ def _get_client():
     return _client
 
 
+def _get_loop():
+    global _loop, _limiter
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gemini-loop", daemon=True).start()
+            _limiter = asyncio.run_coroutine_threadsafe(_make_limiter(), loop).result()
+            _loop = loop
+    return _loop
+
+
+async def _make_limiter():
+    return asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def run_async(coro):
+    """Run a coroutine on the shared Gemini loop from synchronous code and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+async def _on_shared_loop(coro):
+    """Await coro on the shared loop, whichever event loop the caller is running."""
+    loop = _get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+# --- Response cache ---
+
+def set_llm_cache(cache):
+    """Swap the response cache (anything with get(key) / set(key, text)); None disables caching."""
+    global _cache
+    _cache = cache
+
+
+def get_llm_cache_stats():
+    """Return hit/miss counters for this process, hit rate and current cache size."""
+    with _stats_lock:
+        stats = dict(_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["size"] = len(_cache) if _cache is not None else 0
+    return stats
+
+
+# Lookups run on the shared event loop; anything but the in-memory LRU may touch
+# disk (e.g. SQLite), so it runs on a worker thread instead of stalling every call in flight.
+
+async def _cache_get(key):
+    if _cache is None:
+        return None
+    if isinstance(_cache, MemoryCache):
+        text = _cache.get(key)
+    else:
+        text = await asyncio.to_thread(_cache.get, key)
+    with _stats_lock:
+        _cache_stats["hits" if text is not None else "misses"] += 1
+    return text
+
+
+async def _cache_set(key, text):
+    if _cache is None:
+        return
+    if isinstance(_cache, MemoryCache):
+        _cache.set(key, text)
+    else:
+        await asyncio.to_thread(_cache.set, key, text)
+
+
+# --- Gemini calls ---
+
+def _is_retryable(exc):
+    if isinstance(exc, errors.APIError):
+        # code can be None when the error didn't come with an HTTP status
+        return isinstance(exc.code, int) and (exc.code == 429 or exc.code >= 500)
+    return isinstance(exc, httpx.TransportError)
+
+
+async def _limited_call(contents):
+    async with _limiter:
+        return await _get_client().aio.models.generate_content(model=GEMINI_MODEL, contents=contents)
+
+
+async def _generate(contents, deadline):
+    """One generate_content call with a deadline, bounded retries and jittered backoff on 429/5xx.
+
+    The deadline covers waiting for a concurrency slot as well as the request itself.
+    """
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    attempt = 0
+    while True:
+        remaining = give_up_at - loop.time()
+        if remaining <= 0:
+            raise TimeoutError(f"Gemini call exceeded its {deadline:.0f}s deadline")
+        try:
+            response = await asyncio.wait_for(_limited_call(contents), timeout=remaining)
+            return response.text
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Gemini call exceeded its {deadline:.0f}s deadline") from None
+        except Exception as exc:
+            if attempt >= LLM_MAX_RETRIES or not _is_retryable(exc):
+                raise
+            # Full jitter: concurrent sessions hitting a 429 don't retry in lockstep
+            delay = random.uniform(0, min(_RETRY_CAP_S, _RETRY_BASE_S * 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(min(delay, max(give_up_at - loop.time(), 0)))
+
+
+def _image_part(image_bytes, mime_type):
+    """Send image bytes as-is (no PIL round trip); sniff the type from the header if not given."""
+    if mime_type is None:
+        mime_type = Image.MIME[Image.open(io.BytesIO(image_bytes)).format]
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+
+async def _ask_json(prompt, image_bytes, deadline, mime_type=None):
+    key = cache_key(GEMINI_MODEL, prompt, image_bytes)
+    text = await _cache_get(key)
+    if text is not None:
+        return json.loads(_strip_json_fences(text))
+
+    contents = prompt if image_bytes is None else [prompt, _image_part(image_bytes, mime_type)]
+    text = await _generate(contents, deadline)
+    result = json.loads(_strip_json_fences(text))
+    await _cache_set(key, text)  # Only cache replies that parsed
+    return result
+
+
+async def _ask_text(prompt, deadline):
+    key = cache_key(GEMINI_MODEL, prompt)
+    text = await _cache_get(key)
+    if text is None:
+        text = await _generate(prompt, deadline)
+        await _cache_set(key, text)
+    return text.strip()
+
+
+async def ask_json_async(prompt, deadline=LLM_DEADLINE_S):
+    """Async ask_json: send a prompt to Gemini and parse the JSON response."""
+    return await _on_shared_loop(_ask_json(prompt, None, deadline))
+
+
+async def ask_json_with_image_async(prompt, image_bytes, mime_type=None, deadline=LLM_DEADLINE_S):
+    """Async ask_json_with_image: send a prompt + image to Gemini and parse the JSON response."""
+    return await _on_shared_loop(_ask_json(prompt, image_bytes, deadline, mime_type))
+
+
+async def ask_text_async(prompt, deadline=LLM_DEADLINE_S):
+    """Async ask_text: send a prompt to Gemini and return the raw text response."""
+    return await _on_shared_loop(_ask_text(prompt, deadline))
+
+
 def ask_json(prompt):
     """Send a prompt to Gemini and parse the JSON response."""
-    client = _get_client()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
-    return json.loads(_strip_json_fences(response.text))
+    return run_async(_ask_json(prompt, None, LLM_DEADLINE_S))
 
 
 def _strip_json_fences(text):
@@ -41,22 +213,11 @@ def _strip_json_fences(text):
     return text
 
 
-def ask_json_with_image(prompt, image_bytes):
+def ask_json_with_image(prompt, image_bytes, mime_type=None):
     """Send a prompt + image to Gemini and parse the JSON response."""
-    client = _get_client()
-    image = Image.open(io.BytesIO(image_bytes))
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[prompt, image],
-    )
-    return json.loads(_strip_json_fences(response.text))
+    return run_async(_ask_json(prompt, image_bytes, LLM_DEADLINE_S, mime_type))
 
 
 def ask_text(prompt):
     """Send a prompt to Gemini and return raw text response."""
-    client = _get_client()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
-    return response.text.strip()
+    return run_async(_ask_text(prompt, LLM_DEADLINE_S))